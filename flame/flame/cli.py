@@ -1,23 +1,39 @@
 import os, argparse
-from flame import simulation, paint
+import pandas as pd
+from flame import simulation, paint, summary
 
 
 def main():
     """ Command line entry point.
     """
     parser = argparse.ArgumentParser(prog='FLaMe')
-    parser.add_argument('command', choices=['run', 'create', 'paint', 'extract'])
-    parser.add_argument("name", nargs=argparse.REMAINDER)
+    parser.add_argument('command',
+                        choices=['run', 'create', 'paint', 'extract', 'aggregate',
+                                 'merge'])
+    parser.add_argument('--resume', metavar='FILE',
+                        help="continue an interrupted run from its HDF file")
+    parser.add_argument('--decimate', action='store_true',
+                        help="paint the extremes of each pixel column with WebGL only")
+    parser.add_argument("name", nargs='*')
     args = parser.parse_args()
 
     if args.command == 'run':
-        simulation.run(simulation.get_params())
+        if args.resume:
+            simulation.run(resume=args.resume)
+        else:
+            simulation.run(simulation.get_params())
     elif args.command == 'create':
         if not args.name:
             args.name = [os.getcwd().split('/')[-1]]
         simulation.create('_'.join(args.name))
     elif args.command == 'paint':
-        paint.mean_plot(*args.name)
+        paint.mean_plot(*args.name, decimated=args.decimate)
     elif args.command == 'extract':
         for fname in args.name:
             paint.extractor(fname)
+    elif args.command == 'aggregate':
+        for fname in args.name:
+            with pd.HDFStore(fname, 'a') as h5:
+                summary.write_summary(h5)
+    elif args.command == 'merge':
+        simulation.merge_shards(*args.name)
@@ -0,0 +1,111 @@
+""" Grow many flakes with the same twin planes in lockstep.
+
+Growing each sample as its own `Flake` pays the Python overhead of choosing a slot once
+per flake and step. The `Ensemble` keeps the slot sizes of all its members in a single
+array, such that the slots of all members are drawn at once, like the `prob` growth mode
+of each single flake would do.
+"""
+import numpy as np
+
+from flame.growth import Flake
+
+
+class Ensemble():
+    """ Independent flakes with the same twin planes, grown atom by atom together.
+
+    The members start as copies of the same `Flake`. Their slot sizes are kept in the
+    `counts` array with one row per member. In each step the weights of all slots are
+    calculated as in `Flake.temperature_dist`, and one slot and site per member is drawn
+    with a single call of the random number generator.
+
+        Args:
+            *twins: The twin planes of all members.
+            size (int): Number of members.
+            rng (int or numpy.random.Generator): Generator for the draws of all members,
+                an integer seeds a new generator, by default it is seeded from the
+                system.
+            **kwargs: Passed on to `Flake`, e.g. `seed`, `temp` or `backend`.
+    """
+    def __init__(self, *twins, size=10, rng=None, **kwargs):
+        self.rng = np.random.default_rng(rng)
+        self.members = Flake(*twins, **kwargs).fork(size)
+        self.counts = np.array([flake.sites() for flake in self.members], dtype=float)
+        self.columns = list(self.members[0].geometry())
+        self._rates = None
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def iter(self):
+        """ Number of atoms in each member. """
+        return self.members[0].iter
+
+    @property
+    def temp(self):
+        """ The artificial temperature of all members. """
+        return self.members[0].temp
+
+    @temp.setter
+    def temp(self, value):
+        for flake in self.members:
+            flake.temp = value
+        self._rates = None
+
+    def rates(self):
+        """ Return the attachment rate of a single site for each slot, see
+        `Flake.slot_rate`.
+        """
+        if self._rates is None:
+            flake = self.members[0]
+            self._rates = np.array([flake.slot_rate(slot) for slot in flake.maxNB])
+        return self._rates
+
+    def draw_slots(self, rand):
+        """ Return the slot of each member for the relative positions `rand` in [0, 1).
+
+        The same slot is chosen as by the `sampler` of each member for the same position.
+        """
+        weights = self.counts * self.rates()
+        cumulative = np.cumsum(weights, axis=1)
+        slots = (cumulative <= (rand * cumulative[:, -1])[:, None]).sum(axis=1)
+        # guard against rounding onto empty slots at the top
+        highest = weights.shape[1] - 1 - np.argmax(weights[:, ::-1] > 0, axis=1)
+        return np.minimum(slots, highest)
+
+    def step(self):
+        """ Add one atom to each member.
+        """
+        rand = self.rng.random((2, len(self.members)))
+        slots = self.draw_slots(rand[0]).tolist()
+        for flake, counts, slot, pick in zip(self.members, self.counts, slots,
+                                             rand[1].tolist()):
+            for changed in flake.put_atom(flake.surface[slot].pick(pick), slot):
+                counts[changed] = len(flake.surface[changed])
+
+    def grow(self, rounds=1):
+        """ Add `rounds` atoms to each member.
+        """
+        for _ in range(rounds):
+            self.step()
+
+    def snapshot(self):
+        """ Return the `geometry` of all members as array of shape (members, columns).
+        """
+        return np.array([[flake.geometry()[key] for key in self.columns]
+                         for flake in self.members], dtype=float)
+
+    def run(self, total_size, snapshot_interval):
+        """ Grow all members up to `total_size` atoms, with a snapshot of their geometry
+        every `snapshot_interval` atoms.
+
+        Returns an array of shape (members, snapshots, columns), the names of the last
+        axis are in `columns`.
+        """
+        snapshots = []
+        while self.iter < total_size:
+            self.grow(snapshot_interval)
+            snapshots.append(self.snapshot())
+        if not snapshots:
+            return np.empty((len(self), 0, len(self.columns)))
+        return np.stack(snapshots, axis=1)
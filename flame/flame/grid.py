@@ -1,10 +1,18 @@
 import logging
+import numpy as np
 from math import sqrt
 from itertools import product
 
+from flame.settings import DIFF_CAP
+from flame.storage import pack_array, unique_keys, unpack_array
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+""" Nearest neighbour offset tables, shared between all grids with the same twin planes.
+"""
+NEIGHBOUR_TABLES = {}
+
 
 class Grid():
     """
@@ -18,9 +26,13 @@ class Grid():
             twins (int) : An arbitrary-length sequence of integers, the twinned layers.
     """
 
+    SHIFT_CHUNK = 64
+
     def __init__(self, twins):
         self.twins = twins
         self.twin_layers, self.upcounter, self.upsign = self.twin_gen()
+        self.shift_low, self.shift_table = 0, []
+        self.nb_tables = NEIGHBOUR_TABLES.setdefault(tuple(sorted(set(twins))), {})
 
     def twin_gen(self):
         """ Create a representation of the layer permutation .
@@ -49,6 +61,43 @@ class Grid():
         return (twin_layers, counter % 3, sign)
 
     def shift(self, layer):
+        """ Return the permutation shift of `layer` from the shift table.
+
+        The table covers a contiguous range of layers starting at `shift_low`. When a
+        layer outside is requested, the table is extended by `extend_shifts`.
+        """
+        index = layer - self.shift_low
+        if not 0 <= index < len(self.shift_table):
+            self.extend_shifts(layer)
+            index = layer - self.shift_low
+        return self.shift_table[index]
+
+    def extend_shifts(self, layer):
+        """ Extend the shift table to cover `layer`.
+
+        The table grows at least by `SHIFT_CHUNK` layers or its current length, whichever
+        is larger, so repeated extensions during growth are amortized.
+        """
+        chunk = max(self.SHIFT_CHUNK, len(self.shift_table))
+        low, high = self.shift_low, self.shift_low + len(self.shift_table)
+        if not self.shift_table:
+            self.shift_low = low = high = layer
+        if layer < low:
+            new_low = min(layer, low - chunk)
+            self.shift_table[:0] = [self.layer_shift(x) for x in range(new_low, low)]
+            self.shift_low = new_low
+        if layer >= high:
+            new_high = max(layer + 1, high + chunk)
+            self.shift_table.extend(self.layer_shift(x) for x in range(high, new_high))
+
+    def shifts(self, low, high):
+        """ Return the shifts of the layers in `range(low, high)` as array. """
+        self.shift(low)
+        self.shift(high - 1)
+        start = low - self.shift_low
+        return np.array(self.shift_table[start:start + high - low], dtype=np.int64)
+
+    def layer_shift(self, layer):
         """ Performs the permutation shift for twin planes TP = self.twin_gen().
 
         LOW:    Index is smaller than lowest twin plane, or there isn't a TP at all.
@@ -76,11 +125,173 @@ class Grid():
         displacement according to the fcc-stacking and the twin plane configuration.
         """
         i, j, k = idx
+        return self.prototype(i, j, k, self.shift(k))
+
+    def coords(self, idx):
+        """ Return Cartesian coordinates of an (N, 3) array of lattice points.
+
+        The batch version of `coord`, returning an (N, 3) float array. The shifts are
+        looked up once for each layer in the range of `k`, the rest is array arithmetic
+        in the same order of operations as in `prototype`.
+        """
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1, 3)
+        i, j, k = idx.T
+        if len(idx):
+            low = k.min()
+            shift = self.shifts(low, k.max() + 1)[k - low]
+        else:
+            shift = k
+
+        coords = np.empty(idx.shape)
+        coords[:, 0] = 2*i + (j + shift) % 2
+        coords[:, 1] = sqrt(3)*(j + shift/3)
+        coords[:, 2] = k*2*sqrt(6)/3
+        return coords
+
+    def indices(self, coords, tolerance=1e-3):
+        """ Return the lattice points of an (N, 3) array of Cartesian coordinates.
+
+        The inverse of `coords`: the layer `k` follows from `z`, its shift from the shift
+        table, then `j` from `y` and `i` from `x`. Raises a ValueError if any of the
+        coordinates is further than `tolerance` from its lattice point, e.g. because
+        the twin planes do not match.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+        if not len(coords):
+            return np.zeros((0, 3), dtype=np.int64)
+        k = np.rint(coords[:, 2] * 3 / (2*sqrt(6))).astype(np.int64)
+        low = k.min()
+        shift = self.shifts(low, k.max() + 1)[k - low]
+        j = np.rint(coords[:, 1] / sqrt(3) - shift / 3).astype(np.int64)
+        i = np.rint((coords[:, 0] - (j + shift) % 2) / 2).astype(np.int64)
+        idx = np.stack((i, j, k), axis=-1)
+
+        off = np.abs(self.coords(idx) - coords).max(axis=1) > tolerance
+        if off.any():
+            raise ValueError("{} of {} coordinates are not on the lattice of twin "
+                             "planes {}, e.g. {}".format(off.sum(), len(coords),
+                                                         self.twins,
+                                                         coords[off][0].tolist()))
+        return idx
+
+    def enclosed(self, sites):
+        """ Return the empty lattice points enclosed by `sites` as (N, 3) array.
+
+        An enclosed point lies between two sites of its row (same `j` and `k`), all other
+        points reach the outside along their row. So the search covers the span of each
+        row of sites and one point beyond its ends, which is about the size of the flake
+        and its hollow, instead of the whole bounding box. Empty points of the spans with
+        a neighbour outside of them are reached from the outside, the enclosed points are
+        those which can not be reached from there through neighbouring empty points.
+        Used to fill the hollow inside of carved flakes, see `Flake.carve`.
+        """
+        sites = np.asarray(sites, dtype=np.int64).reshape(-1, 3)
+        if not len(sites):
+            return sites
+        rows = sites[np.lexsort((sites[:, 0], sites[:, 1], sites[:, 2]))]
+        first = np.flatnonzero(np.concatenate(
+            ([True], (rows[1:, 1:] != rows[:-1, 1:]).any(axis=1))))
+        last = np.concatenate((first[1:], [len(rows)])) - 1
+        low, lengths = rows[first, 0] - 1, rows[last, 0] - rows[first, 0] + 3
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths,
+                                                       lengths)
+        spans = np.column_stack((np.repeat(low, lengths) + offsets,
+                                 np.repeat(rows[first, 1], lengths),
+                                 np.repeat(rows[first, 2], lengths)))
+        span_keys = np.sort(pack_array(spans))
+
+        void_keys = span_keys[~np.isin(span_keys, pack_array(sites))]
+        neighbours = pack_array(self.neighbour_array(unpack_array(void_keys)))
+        inside = np.isin(neighbours, span_keys).reshape(-1, 12).all(axis=1)
+        frontier = reached = void_keys[~inside]
+        while len(frontier):
+            candidates = unique_keys(pack_array(self.neighbour_array(
+                unpack_array(frontier))))
+            candidates = candidates[np.isin(candidates, void_keys, assume_unique=True)]
+            frontier = candidates[~np.isin(candidates, reached, assume_unique=True)]
+            reached = np.union1d(reached, frontier)
+        return unpack_array(void_keys[~np.isin(void_keys, reached, assume_unique=True)])
+
+    @staticmethod
+    def prototype(i, j, k, shift):
+        """ Return the Cartesian vector of (i, j, k) for an explicit layer `shift`.
+        """
+        return Vector(2*i + (j + shift) % 2,
+                      sqrt(3)*(j + shift/3),
+                      k*2*sqrt(6)/3)
+
+    def neighbour_offsets(self, idx):
+        """ Return the 12 index-space offsets of the nearest neighbours of `idx`.
+
+        The real-space neighbourhood of a site only depends on the shifts of its own and
+        the two adjacent layers, and on the parity of the row `(j + shift) % 2`. Each
+        such configuration is evaluated once against `DIFF_CAP` and stored in
+        `nb_tables`, which is shared by all grids with the same twin planes.
+        """
+        _, j, k = idx
         shift = self.shift(k)
-        prototype = Vector(2*i + (j + shift) % 2,
-                           sqrt(3)*(j + shift/3),
-                           k*2*sqrt(6)/3)
-        return prototype
+        return self.config_offsets((self.shift(k - 1), shift, self.shift(k + 1),
+                                    (j + shift) % 2))
+
+    def config_offsets(self, config):
+        """ Return the neighbour offsets of a configuration from `nb_tables`, see
+        `neighbour_offsets`.
+        """
+        try:
+            return self.nb_tables[config]
+        except KeyError:
+            offsets = self.offset_table(*config)
+            self.nb_tables[config] = offsets
+            return offsets
+
+    def offset_table(self, lower, middle, upper, parity):
+        """ Filter all 26 index offsets by their real-space distance.
+
+        A representative site with the requested row `parity` is placed in the middle
+        layer, the offsets below the `DIFF_CAP` distance are returned as a tuple.
+        """
+        shifts = {-1: lower, 0: middle, 1: upper}
+        row = (parity - middle) % 2
+        center = self.prototype(0, row, 0, middle)
+
+        offsets = []
+        for di, dj, dk in product(range(-1, 2), repeat=3):
+            if (di, dj, dk) == (0, 0, 0):
+                continue
+            site = self.prototype(di, row + dj, dk, shifts[dk])
+            if center.dist(site) < DIFF_CAP:
+                offsets.append((di, dj, dk))
+        return tuple(offsets)
+
+    def neighbours(self, idx):
+        """ Return the nearest neighbours of `idx` in index space.
+        """
+        i, j, k = idx
+        return [(i + di, j + dj, k + dk) for di, dj, dk in self.neighbour_offsets(idx)]
+
+    def neighbour_array(self, idx):
+        """ Return the nearest neighbours of an (N, 3) array of lattice points.
+
+        The batch version of `neighbours`, returning an (N, 12, 3) integer array. The
+        configuration of each site is encoded as a single integer below 54, such that the
+        offset table of each distinct configuration is looked up only once.
+        """
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1, 3)
+        if not len(idx):
+            return np.empty((0, 12, 3), dtype=np.int64)
+        j, k = idx[:, 1], idx[:, 2]
+        low = k.min() - 1
+        shifts = self.shifts(low, k.max() + 2)
+        lower, middle, upper = (shifts[k - low + dk] for dk in (-1, 0, 1))
+        code = ((lower*3 + middle)*3 + upper)*2 + (j + middle) % 2
+
+        tables = np.zeros((54, 12, 3), dtype=np.int64)
+        for config in np.flatnonzero(np.bincount(code, minlength=54)).tolist():
+            rest, parity = divmod(config, 2)
+            rest, upper = divmod(rest, 3)
+            lower, middle = divmod(rest, 3)
+            tables[config] = self.config_offsets((lower, middle, upper, parity))
+        return idx[:, None, :] + tables[code]
 
 
 class Seed():
@@ -132,6 +343,43 @@ class Seed():
             seed = self.raw_seeds['point']
         return len(seed), seed.copy()
 
+    @staticmethod
+    def _box(i_max, j_max, layers):
+        """ Return all lattice points with |i| <= `i_max`, |j| <= `j_max` and k in
+        `layers` as (N, 3) array.
+        """
+        i = np.arange(-int(i_max) - 1, int(i_max) + 2)
+        j = np.arange(-int(j_max) - 1, int(j_max) + 2)
+        grid = np.meshgrid(i, j, np.asarray(layers), indexing='ij')
+        return np.stack(grid, axis=-1).reshape(-1, 3)
+
+    @staticmethod
+    def sphere(radius, grid=None):
+        """ Return the lattice points within `radius` around the origin as (N, 3) array.
+
+        The `radius` is given in the units of `Grid.coord`, where neighbouring atoms are
+        2 apart. The layers are stacked like in `grid`, by default without twin planes.
+        """
+        grid = grid or Grid(())
+        k_max = int(radius * 3 / (2*sqrt(6)))
+        idx = Seed._box(radius / 2, radius / sqrt(3), range(-k_max - 1, k_max + 2))
+        dist = grid.coords(idx) - grid.coords((0, 0, 0))
+        return idx[(dist**2).sum(axis=1) <= radius**2]
+
+    @staticmethod
+    def plate(layers, width, grid=None):
+        """ Return a disc of `layers` layers from k = 0 upwards as (N, 3) array.
+
+        Each layer holds the lattice points within `width / 2` of its site (0, 0, k),
+        in the units of `Grid.coord`. The layers are stacked like in `grid`, by default
+        without twin planes.
+        """
+        grid = grid or Grid(())
+        idx = Seed._box(width / 4, width / (2*sqrt(3)), range(layers))
+        center = idx * [0, 0, 1]
+        dist = grid.coords(idx) - grid.coords(center)
+        return idx[(dist**2).sum(axis=1) <= (width / 2)**2]
+
 
 class Vector():
     """ Self defined Vector object.
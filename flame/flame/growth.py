@@ -1,11 +1,17 @@
-from math import pi
+from math import pi, log
 from collections import deque
-from random import choice, random
-import itertools as it
 import logging
+import numpy as np
+from io import StringIO
+from ast import literal_eval
+from os import path
 
 from flame.grid import Grid, Seed
-from flame.settings import blender_helper, DIFF_CAP, AtomsIO
+from flame.storage import (BACKENDS, boundary_array, boundary_sites, pack_array,
+                           site_array, unique_keys, unpack_array)
+from flame.sampling import SlotSampler
+from flame.rng import RandomStream
+from flame.settings import blender_helper, NPZ_EXT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,25 +41,53 @@ class Flake():
         trail (int): trail length
             How many atoms will be marked as atoms trail
 
-        seed (str): seed name
+        seed (str or array): seed name
             from one of the following possibilities:[point, sphere, cube, bigcube, plane]
+            or the sites of a custom seed as (N, 3) array, e.g. from `Seed.sphere` or
+            `Seed.plate`.
 
         temp (float): Artificial temperatures
             Accepted range [0 .. 1000].
             Lower temperatures lead to cleaner crystals in probabilty growth mode.
+
+        backend (str): storage backend of atoms and surface sites
+            Either `set` (default) for Python tuples, `packed` for 64 bit integer keys
+            in compact arrays, or `chunked` for atoms in block bitmaps, see the
+            `storage` module. The `packed` backend takes four to five times less memory
+            per atom, but grows about seven times slower than `set`, so it only pays
+            off for flakes which would not fit into memory otherwise.
+
+        time (float): Simulated time
+            Advanced by the kinetic Monte Carlo growth mode `kmc`, in units of the
+            inverse attachment rate of `slot_rate`.
+
+        rng (int, numpy.random.SeedSequence or RandomStream): random number generator
+            All random choices of the Flake are drawn from its own `RandomStream`, such
+            that the growth can be reproduced and continued after `save` and `load`. A
+            seed creates a new stream, by default it is seeded from the system.
     """
     def __init__(self, *twins, **kwargs):
         self.twins = twins
         self.maxNB = range(12)
 
         self.seed_shape = kwargs.get('seed', 'sphere')
-        self.iter, self.atoms = Seed().seed_gen(self.seed_shape)
+        self.backend = BACKENDS[kwargs.get('backend', 'set')]
+        if isinstance(self.seed_shape, str):
+            self.iter, seed = Seed().seed_gen(self.seed_shape)
+        else:
+            seed = set(map(tuple, site_array(self.seed_shape).tolist()))
+            self.seed_shape, self.iter = 'custom', len(seed)
+        self.atoms = self.backend.atoms(seed)
         self.trail_length = kwargs.get('trail', 20)
         self.trail = deque(maxlen=self.trail_length)
-        self.temp = kwargs.get('temp', 100)
+        self._temp = kwargs.get('temp', 100)
+        self.time = 0.0
+        rng = kwargs.get('rng')
+        self.rng = rng if isinstance(rng, RandomStream) else RandomStream(rng)
 
         self.grid = Grid(twins)
         self._create_entire_surface()
+        self._track_extremes()
 
 
     def __repr__(self):
@@ -63,38 +97,61 @@ class Flake():
                 "[{}K]".format(self.twins, self.iter, self.seed_shape, self.temp))
 
 
-####################
-#     SURFACE     #
-####################
-    def _set_surface(self, site):
-        """ Adds an empty site to the corresponding surface slot.
+    @property
+    def temp(self):
+        """ The artificial temperature of the growth.
+
+        Setting a new temperature invalidates the cached slot rates of the `sampler`,
+        such that temperature ramps during the growth are taken into account.
         """
-        occupied_neighbours = self.real_neighbours(site, void=False)
-        slot = len(occupied_neighbours)
-        self.surface[slot].add(site)
+        return self._temp
+
+    @temp.setter
+    def temp(self, value):
+        self._temp = value
+        self.sampler.invalidate()
 
 
+####################
+#     SURFACE     #
+####################
     def _create_entire_surface(self):
         """ Generate the list for the surface sites based on occupied sites.
 
-        Create a list of 12 sets (each corresponding to the  possibilities of next
-        neighbours). Iterates through every atom and populates each adjacent empty site
-        to the surface list.
+        Create a list of 12 indexed sets (each corresponding to the  possibilities of
+        next neighbours), which allow to pick a random site in constant time. The surface
+        is built in bulk with arrays of packed sites (see `storage`): the neighbours of
+        all atoms are the candidate voids, the occupied neighbours of each void are
+        counted by a lookup in the sorted atoms, and the voids are put into the slot of
+        their count, in order of their packed keys. A void enclosed by 12 atoms is a
+        bubble in slot zero, like in `put_atom`. Atoms deep inside the flake are skipped,
+        if the storage backend can tell them apart. The `site_slot` dictionary maps each
+        surface site to its slot, such that finding or promoting a site is a single
+        lookup. The `sampler` keeps track of the weighted slot sizes for the
+        probabilistic growth.
         """
-        self.surface = [set() for _ in self.maxNB]
-        for atom in self.atoms:
-            adjacent_voids = self.real_neighbours(atom, void=True)
-            for nb in adjacent_voids:
-                self._set_surface(nb)
+        atoms = np.sort(pack_array(site_array(self.atoms)))
+        candidates = unique_keys(pack_array(self.grid.neighbour_array(
+            boundary_array(self.atoms))))
+        voids = candidates[~np.isin(candidates, atoms, assume_unique=True)]
+        neighbours = pack_array(self.grid.neighbour_array(unpack_array(voids)))
+        slots = np.isin(neighbours, atoms).reshape(-1, 12).sum(axis=1) % 12
+
+        self.surface = []
+        self.site_slot = self.backend.index()
+        voids = unpack_array(voids).tolist()
+        for slot in self.maxNB:
+            shelf = [tuple(voids[n]) for n in np.flatnonzero(slots == slot).tolist()]
+            self.surface.append(self.backend.slot(shelf))
+            for site in shelf:
+                self.site_slot[site] = slot
+        self.sampler = SlotSampler(self.surface, self.slot_rate)
 
 
     def integrated_surface(self):
         """ Return a set with all surface sites.
         """
-        integrated_surface = set()
-        for index in self.maxNB:
-            integrated_surface.update(self.surface[index])
-        return integrated_surface
+        return set(self.site_slot)
 
 
     def sites(self):
@@ -121,10 +178,42 @@ class Flake():
             occupied_surface = self.real_neighbours(spot, void=False)
             skin.update(occupied_surface)
 
-        self.atoms = skin
+        self.atoms = self.backend.atoms(skin)
+        self._track_extremes()
+
+
+    def _track_extremes(self):
+        """ Recalculate the extremes of the atoms, which `put_atom` keeps up to date.
+        """
+        extremes = self.extremes(boundary_sites(self.atoms))
+        self.z_min, self.z_max, self.outermost = extremes
+
 
+    @staticmethod
+    def extremes(atoms):
+        """ Return lowest and highest layer and the outermost atom of `atoms`.
 
-    def geometry(self):
+        The outermost atom has the largest in-plane index distance `i**2 + j**2`, ties
+        are resolved by comparing the indices, such that the result does not depend on
+        the order of iteration. It is returned as tuple (distance, atom).
+        """
+        atoms = iter(atoms)
+        first = next(atoms)
+        z_min = z_max = first[2]
+        outermost = (first[0]**2 + first[1]**2, first)
+        for atom in atoms:
+            i, j, k = atom
+            if k < z_min:
+                z_min = k
+            elif k > z_max:
+                z_max = k
+            candidate = (i*i + j*j, atom)
+            if candidate > outermost:
+                outermost = candidate
+        return z_min, z_max, outermost
+
+
+    def geometry(self, full=False):
         """ Calculate geometry information about the Flake.
 
         Here we generate all the data of the growth process we will later use. The
@@ -137,14 +226,18 @@ class Flake():
         `area`: pi*radius**2
         `aspect ratio`: comparison between the vertical and horizontal dimension
         (2*radius/height)
+        `time`: simulated time of the kinetic Monte Carlo growth
+
+        The extremes of the atoms are tracked by `put_atom`, so this takes constant time.
+        With `full` they are recalculated from all atoms instead, to verify the former.
         """
         COORD = self.grid.coord
-        POOL = self.atoms
         SITES = self.sites()
 
-        mxz = max(POOL, key=lambda i: i[2])[2]
-        mnz = min(POOL, key=lambda i: i[2])[2]
-        max_outer = max(POOL, key=lambda i: i[0]**2 + i[1]**2)
+        if full:
+            mnz, mxz, (_, max_outer) = self.extremes(boundary_sites(self.atoms))
+        else:
+            mnz, mxz, (_, max_outer) = self.z_min, self.z_max, self.outermost
         mean_binds = sum(weight*i for i, weight in
                          enumerate(num/sum(SITES) for num in SITES))
 
@@ -169,42 +262,132 @@ class Flake():
         attr.update({
             'bindings': mean_binds
         })
+        attr.update({
+            'time': self.time
+        })
 
         for (k, i) in attr.items():
             setattr(self, k, i)
         return attr
 
 
-#########################
-#     NEIGHBOURHOOD     #
-#########################
-    def abs_neighbours(self, atom):
-        """ Return the list of next neighbours in index space of atom `idx`.
+###################
+#     STATE     #
+###################
+    def save(self, fname):
+        """ Save the full state of the Flake in the binary `numpy` format **npz**.
+
+        The arrays of `to_arrays` are stored, hence a loaded Flake continues the growth
+        exactly like the saved one would have. Returns the name of the written file.
         """
-        absNB = set(it.product(range(-1, 2), repeat=3))         # create NN indices
-        absNB.remove((0, 0, 0))
-        pairs = (zip(atom, nn) for nn in absNB)
-        return [tuple(sum(y) for y in x) for x in pairs]
+        if not fname.endswith(NPZ_EXT):
+            fname += NPZ_EXT
+        np.savez_compressed(fname, **self.to_arrays())
+        return fname
 
 
-    def real_neighbours(self, atom, void=False):
-        """ Creates next neighbours based on the distances.
+    @classmethod
+    def load(cls, fname):
+        """ Load a Flake saved with `save`.
 
-        * build all neighbouring (1, -1, 0) index permutations of `atom`
-        * get coordinates of all surrounding sites
-        * get vector differences between the atom and its neighbours
-        * filter those, which are larger than DIFF_CAP
-        * return `void` or `occupied` neighbours
+        The surface is restored from the file, not generated again from the atoms.
+        """
+        with np.load(fname) as data:
+            return cls.from_arrays(data)
+
+
+    def to_arrays(self):
+        """ Return the full state of the Flake as dictionary of `numpy` arrays.
+
+        Atoms, surface slots and trail are stored as integer arrays of indices. The
+        surface sites keep their order within a slot and the state of the random number
+        generator is included.
+        """
+        return {
+            'twins': np.array(self.twins, dtype=np.int64),
+            'seed_shape': np.array(self.seed_shape),
+            'backend': np.array(self.backend.name),
+            'iter': np.array(self.iter),
+            'temp': np.array(self._temp),
+            'time': np.array(self.time),
+            'atoms': site_array(self.atoms),
+            'surface': np.concatenate([site_array(shelf) for shelf in self.surface]),
+            'slot_sizes': np.array(self.sites(), dtype=np.int64),
+            'trail': site_array(self.trail),
+            'trail_length': np.array(self.trail_length),
+            'rng_state': np.array(repr(self.rng.getstate()))}
+
+
+    @classmethod
+    def from_arrays(cls, data, rng=None):
+        """ Create a Flake from the arrays of `to_arrays`.
+
+        The random number generator continues from the stored state, unless another
+        `rng` is given, see the `Flake` arguments.
+        """
+        def sites(key):
+            return [tuple(site) for site in data[key].tolist()]
+
+        flake = cls.__new__(cls)
+        flake.twins = tuple(data['twins'].tolist())
+        flake.maxNB = range(12)
+        flake.seed_shape = str(data['seed_shape'])
+        flake.backend = BACKENDS[str(data['backend'])]
+        flake.iter = data['iter'].item()
+        flake.atoms = flake.backend.atoms(sites('atoms'))
+        flake.trail_length = data['trail_length'].item()
+        flake.trail = deque(sites('trail'), maxlen=flake.trail_length)
+        flake._temp = data['temp'].item()
+        flake.time = data['time'].item()
+        if rng is None:
+            flake.rng = RandomStream.from_state(literal_eval(str(data['rng_state'])))
+        else:
+            flake.rng = rng if isinstance(rng, RandomStream) else RandomStream(rng)
+        flake.grid = Grid(flake.twins)
+
+        flake.surface = []
+        flake.site_slot = flake.backend.index()
+        surface = sites('surface')
+        start = 0
+        for slot, size in enumerate(data['slot_sizes'].tolist()):
+            shelf = surface[start:start + size]
+            flake.surface.append(flake.backend.slot(shelf))
+            for site in shelf:
+                flake.site_slot[site] = slot
+            start += size
+        flake.sampler = SlotSampler(flake.surface, flake.slot_rate)
+        flake._track_extremes()
+        return flake
+
+
+    def __reduce__(self):
+        """ Pickle the Flake through the compact arrays of `to_arrays`.
+        """
+        return type(self).from_arrays, (self.to_arrays(),)
 
-        TODO:  choose meaningful atomic radius
+
+    def fork(self, n):
+        """ Return `n` independent copies of the Flake to continue the growth.
+
+        The copies share the state of the Flake, but each gets its own random number
+        stream, spawned from the stream of this Flake. The branches can be pickled
+        cheaply to other processes, see `to_arrays`.
         """
-        indexed = self.abs_neighbours(atom)
-        coordinates = (self.grid.coord(ai_site) for ai_site in indexed)
-        choice_vec = self.grid.coord(atom)
-        diffs = (choice_vec.dist(ac_site) for ac_site in coordinates)
-        associated = zip(indexed, diffs)
+        state = self.to_arrays()
+        return [self.from_arrays(state, rng=stream) for stream in self.rng.spawn(n)]
+
 
-        nearest = (nb for nb, diff in associated if diff < DIFF_CAP)
+#########################
+#     NEIGHBOURHOOD     #
+#########################
+    def real_neighbours(self, atom, void=False):
+        """ Return the nearest neighbours of `atom`.
+
+        * look up the 12 next neighbours in index space from the precomputed offset
+          tables of the grid (see `Grid.neighbour_offsets`)
+        * return `void` or `occupied` neighbours
+        """
+        nearest = self.grid.neighbours(atom)
         if void:
             return [nb for nb in nearest if nb not in self.atoms]
         else:
@@ -218,35 +401,56 @@ class Flake():
         """ * remove atom from its surface slot
             * append to atoms list
             * check which neighbours are free, with those:
-                * check every slot if it contains the neighbour
+                * look up their slot in `site_slot`
                 * remove it from there
                 * add it to next higher slot (cause now it has one more neighbour)
+            * update the weights of all changed slots in the `sampler`
+            * update the extremes used in `geometry`
+
+        Returns the set of slots which changed their size.
         """
         self.surface[slot].remove(at)
+        del self.site_slot[at]
         self.atoms.add(at)
 
+        i, j, k = at
+        if k < self.z_min:
+            self.z_min = k
+        elif k > self.z_max:
+            self.z_max = k
+        outer = (i*i + j*j, at)
+        if outer > self.outermost:
+            self.outermost = outer
+
         if len(self.trail) >= self.trail.maxlen:
             self.trail.pop()
         self.trail.appendleft(at)       # prepends new atom to list of latest additions
 
+        changed = {slot}
         empty_neighbours = self.real_neighbours(at, void=True)
         for each in empty_neighbours:
-            for e_slot, lst in enumerate(self.surface):
-                if each in lst:
-                    self.surface[e_slot].remove(each)
-                    try:
-                        self.surface[e_slot + 1].add(each)
-                    except IndexError:
-                        """ When this occours, we the surface is completely surrounded
-                            by atoms, hence creating a bubble. We move those to surface
-                            zero, which is otherwise unused.
-                        """
-                        self.surface[0].add(each)
-                        logger.info("Bubble created...oO >> Site: {}".format(each))
-                    break
+            e_slot = self.site_slot.get(each)
+            if e_slot is None:
+                new_slot = 1                    # create new surface entry for new ones
             else:
-                self.surface[1].add(each)        # create new surface entry for new ones
+                self.surface[e_slot].remove(each)
+                changed.add(e_slot)
+                new_slot = e_slot + 1
+                if new_slot not in self.maxNB:
+                    """ When this occours, we the surface is completely surrounded
+                        by atoms, hence creating a bubble. We move those to surface
+                        zero, which is otherwise unused.
+                    """
+                    new_slot = 0
+                    logger.info("Bubble created...oO >> Site: {}".format(each))
+            self.surface[new_slot].add(each)
+            self.site_slot[each] = new_slot
+            changed.add(new_slot)
+
+        for each in changed:
+            self.sampler.update(each)
         self.iter += 1
+        return changed
 
 
     def grow(self, rounds=1, mode='prob', **kwargs):
@@ -255,7 +459,8 @@ class Flake():
         The choices we get from each growth are then passed to the `put_atom` method,
         which then changes the atoms and surface of our flake.
         """
-        modes = {'prob': self.prob_grow, 'rand': self.rand_grow, 'det': self.det_grow}
+        modes = {'prob': self.prob_grow, 'rand': self.rand_grow, 'det': self.det_grow,
+                 'kmc': self.kmc_grow}
 
         for step in range(rounds):
             self.put_atom(*modes[mode](**kwargs))
@@ -264,24 +469,33 @@ class Flake():
     def prob_grow(self, rounds=1):
         """ The probabilistic growth mode, the most relevant in this simulation.
 
-        The `temperature_dist` method returns the weights for each slot depending on
-        slotnumber, temperature and number of atoms occupying that slot.
+        Each slot is weighted like in `temperature_dist`, depending on slotnumber,
+        temperature and number of atoms occupying that slot.
 
-        All those weights are then added to our probability stack, where we randomly
-        choose a point on this stack `stack_pointer`. To get the choice on which slot, we
-        'consume' the weights-stack from the bottom upwards, until the 'stack-pointer' is
-        reached. By breaking at this point we have the added probabilities as height on
-        the stack and chosen our slot where the 'stack-pointer' lies.
+        All those weights are stacked in the `sampler`, where we randomly choose a point
+        on this stack. The sampler keeps the weights as partial sums in a tree, which is
+        updated in `put_atom`, so finding the slot where the point lies does not require
+        to recalculate or walk all the weights.
         """
-        # Here we save time by executing the function only once
-        weights = self.weights()
-        stack_pointer = random()*sum(weights)
+        slot = self.sampler.draw(self.rng.random())
+        chosen = self.surface[slot].pick(self.rng.random())
 
-        for slot, w in enumerate(weights):
-            stack_pointer -= w
-            if stack_pointer < 0:
-                break
-        chosen = choice(tuple(self.surface[slot]))
+        return chosen, slot
+
+
+    def kmc_grow(self):
+        """ Rejection-free kinetic Monte Carlo growth (BKL or n-fold way algorithm).
+
+        Every surface site is an attachment event with the rate of its slot from
+        `slot_rate`. The event is chosen like in `prob_grow` from the cumulative rates in
+        the `sampler`, which is exactly the probability of this event to happen first.
+        The simulated `time` is then advanced by an exponentially distributed waiting
+        time with the total rate of all events.
+        """
+        total_rate = self.sampler.total()
+        slot = self.sampler.draw(self.rng.random())
+        chosen = self.surface[slot].pick(self.rng.random())
+        self.time -= log(1 - self.rng.random()) / total_rate
 
         return chosen, slot
 
@@ -302,6 +516,14 @@ class Flake():
     def temperature_dist(self, slot, temp=None):
         """ Create the probabilty distribution for the surface.
 
+        The rate of a single site of `slot` times the number of sites in there.
+        """
+        return len(self.surface[slot]) * self.slot_rate(slot, temp)
+
+
+    def slot_rate(self, slot, temp=None):
+        """ Return the attachment rate of a single site in `slot`.
+
         Depends on the slot (the more bindings,  the more probable it is to attach)
         scaled with an artificial temperature.
         """
@@ -317,7 +539,7 @@ class Flake():
         if slot not in self.maxNB:
             raise IndexError("Slot must be in the range of next neighbours.")
 
-        func = len(self.surface[slot]) * slot**(SCALE * (UPPER_T - temp))
+        func = slot**(SCALE * (UPPER_T - temp))
         return func
 
 
@@ -327,7 +549,7 @@ class Flake():
         """
         for slot in range(11, cap, -1):
             if self.surface[slot]:
-                chosen = choice(tuple(self.surface[slot]))
+                chosen = self.surface[slot].pick(self.rng.random())
                 return chosen, slot
         else:
             raise StopIteration("Caplimit of <{}> for minimun free bindings reached.\n"
@@ -336,10 +558,15 @@ class Flake():
 
     def rand_grow(self):
         """ Choose uniformly between any valid surface site.
+
+        First a slot is chosen according to its size, then a site within that slot.
         """
-        chosen = choice(list(it.chain.from_iterable(self.surface)))
-        slot = next(i for i, x in enumerate(self.surface) if chosen in x)
-        return chosen, slot
+        stack_pointer = int(self.rng.random()*len(self.site_slot))
+        for slot, shelf in enumerate(self.surface):
+            stack_pointer -= len(shelf)
+            if stack_pointer < 0:
+                break
+        return self.surface[slot].pick(self.rng.random()), slot
 
 
 ##################
@@ -349,6 +576,7 @@ class Flake():
         """ Exports the **xyz**-coordinates of the Flake atoms.
         Adapted from Atomic Blender, can be imported with xyz_io_mesh.
         Text format with a header and four columns: [ELEMENT, X, Y, Z]
+        The coordinates of all atoms are calculated at once by `Grid.coords`.
         """
         geostr = ''.join(str((k, v)) + '\n' for k, v in self.geometry().items())
         header, xyzfile, infofile = blender_helper(name)
@@ -356,19 +584,13 @@ class Flake():
         attributes = header.format(twin=self.twins, temp=self.temp,
                                    shape=self.seed_shape, geo=geostr)
 
-        output = ['{}\n'.format(len(self.atoms))]
-        raw_atoms = (AtomsIO('Au', tuple(self.grid.coord(at))) for at in self.atoms)
-
-        for atom in raw_atoms:
-            string = '{:3s}{:15.5f}{:15.5f}{:15.5f}'.format(
-                atom.element,
-                atom.location[0],
-                atom.location[1],
-                atom.location[2])
-            output.append(string)
+        locations = self.grid.coords(site_array(self.atoms))
+        output = StringIO()
+        np.savetxt(output, locations, fmt='{:3s}'.format('Au') + 3*'%15.5f')
 
         with open(xyzfile, 'w') as handler:
-            handler.write('\n'.join(output))
+            handler.write('{}\n\n'.format(len(locations)))
+            handler.write(output.getvalue().rstrip('\n'))
 
         with open(infofile, 'w') as handler:
             handler.write(attributes)
@@ -376,6 +598,53 @@ class Flake():
         return infofile
 
 
+    @classmethod
+    def import_coordinates(cls, xyzfile, twins=None, fill=True, **kwargs):
+        """ Create a Flake from an **xyz** file written by `export_coordinates`.
+
+        All coordinates are read at once and mapped back to lattice points by
+        `Grid.indices`, which raises a ValueError if they do not fit the lattice. The
+        twin planes and temperature are read from the **info** file next to it, unless
+        given. With `fill` the hollow inside of a carved flake is filled again, see
+        `Grid.enclosed`. The atoms are the seed of the new Flake, further keyword
+        arguments are passed on to it.
+        """
+        info = cls._read_info(path.splitext(xyzfile)[0] + '.info')
+        if twins is None:
+            try:
+                twins = info['twins']
+            except KeyError:
+                raise ValueError("No twin planes given for {}".format(xyzfile))
+        if 'temp' in info:
+            kwargs.setdefault('temp', info['temp'])
+
+        grid = Grid(tuple(twins))
+        coords = np.loadtxt(xyzfile, skiprows=2, usecols=(1, 2, 3), ndmin=2)
+        sites = grid.indices(coords)
+        if fill:
+            sites = np.concatenate((sites, grid.enclosed(sites)))
+        return cls(*twins, seed=sites, **kwargs)
+
+
+    @staticmethod
+    def _read_info(infofile):
+        """ Return the twin planes and temperature of an **info** file as dictionary.
+        """
+        info = {}
+        try:
+            with open(infofile) as handler:
+                lines = handler.read().splitlines()
+        except IOError:
+            return info
+        for line in lines:
+            key, _, value = line.strip().partition(': ')
+            if key == 'Twinplanes':
+                info['twins'] = tuple(literal_eval(value))
+            elif key == 'Temperature':
+                info['temp'] = literal_eval(value)
+        return info
+
+
     def colorize(self):
         """ Generate colors for visual representation of atoms and surface sites.
 
@@ -388,21 +657,20 @@ class Flake():
         colors = dict((at, 15) for at in self.atoms)
         colors.update((at, 13) for at in self.trail)
         colors.update({(0, 0, 0): 14})      # mark the middle spot
-        colors.update([(entry, slot) for slot, shelf in enumerate(self.surface)
-                       for entry in shelf])
+        colors.update(self.site_slot)
         logger.info("Color generation finished.")
         return colors
 
 
     def plot(self, ret=False):
-        """ Transforms the `colors` list to 4 lists of x, y, z, c.
+        """ Transforms the `colors` list to 4 arrays of x, y, z, c.
 
         This list, the `clist` is either returned or displayed in mayavi.
         """
-        coords = self.grid.coord
         colors = self.colorize()
-        clist = zip(*[(coords(idx).x, coords(idx).y, coords(idx).z, c) for
-                      (idx, c) in colors.items()])
+        xyz = self.grid.coords(site_array(colors.keys()))
+        clist = (xyz[:, 0], xyz[:, 1], xyz[:, 2],
+                 np.fromiter(colors.values(), dtype=int, count=len(colors)))
         if ret:
             logger.info("Returning (x, y, z, colors) columns")
             return clist
@@ -1,31 +1,56 @@
+import pickle
 import logging
+import numpy as np
 import pandas as pd
-from os import path, mkdir
+from multiprocessing import Pool
+from os import cpu_count, path, mkdir, remove, replace, stat
 from bokeh.layouts import column as bokeh_column
+from bokeh.models import ColumnDataSource
 from bokeh.plotting import figure, output_file, show
 
-from flame.growth import Flake
-from flame.settings import GRAPH_OUTPUT, HDF_METADATA, get_colors
+from flame.summary import (configuration_samples, configurations, has_summary, layout,
+                           parameters, summary_means)
+from flame.settings import CACHE_EXT, GRAPH_OUTPUT, get_colors
 
 logger = logging.getLogger(__name__)
 
 
 def extractor(file_path):
-    h5 = pd.HDFStore(file_path, 'r')
+    with pd.HDFStore(file_path, 'r') as h5:
+        logger.info("{}\t{}\t{}".format(20*'>', file_path, 20*'<'))
+        for key, val in parameters(h5).items():
+            logger.info("{}:{}{}".format(key, (20-len(key))*" ", val))
+        logger.info("{}:{}{} layout, {} configurations, summary: {}".format(
+            'HDF', 17*" ", layout(h5), len(configurations(h5)), has_summary(h5)))
 
-    logger.info("{}\t{}\t{}".format(20*'>', file_path, 20*'<'))
-    for key, val in h5.parameters.items():
-        logger.info("{}:{}{}".format(key, (20-len(key))*" ", val))
-    h5.close()
 
-
-def mscatter(p, x, y, marker, color, legend=None):
+def mscatter(p, x, y, marker, color, legend=None, source=None):
     """ Shamelessly stolen from bokeh documentation.
 
-    This is basically an intermediate layer to simplify scatter creation.
+    This is basically an intermediate layer to simplify scatter creation. With a
+    `source`, `x` and `y` are the names of its columns.
     """
+    xargs = {'source': source} if source is not None else {}
+    if legend:
+        xargs['legend_label'] = legend
     p.scatter(x, y, marker=marker, size=5,
-              line_color=color, fill_color=color, alpha=0.6, legend=legend)
+              line_color=color, fill_color=color, alpha=0.6, **xargs)
+
+
+def decimate(frame, columns, buckets, x='iter'):
+    """ Return the rows of `frame` holding the minimum or maximum of any of `columns`
+    within each of `buckets` equally wide ranges of `x`.
+
+    Peaks survive, while at most two rows per bucket and column are kept, however many
+    rows the frame has. Frames with fewer rows are returned as they are.
+    """
+    frame = frame.reset_index(drop=True)
+    if len(frame) <= 2 * buckets:
+        return frame
+    grouped = frame[list(columns)].groupby(pd.cut(frame[x], buckets, labels=False))
+    keep = np.concatenate([grouped.idxmin().values.ravel(),
+                           grouped.idxmax().values.ravel()])
+    return frame.loc[np.unique(keep[~pd.isnull(keep)].astype(int))]
 
 
 def cols_output(file_path):
@@ -46,29 +71,50 @@ def cols_output(file_path):
     return output_dir, fname, name
 
 
-def mean_plot(file_path, *columns):
+def mean_plot(file_path, *columns, processes=None, decimated=False):
     """ Paint bokeh over the mean of samples for each twinplane configuration.
 
     Outputs to html file in `output/graph/<filebasename>/geometry_##_cols.html`.
+    The averages are loaded once for all columns, see `load_averages`, with a pool of
+    `processes` (None for all cores).
+
+    In the `decimated` mode each configuration is reduced to the extremes of each pixel
+    column, see `decimate`, and put into a single data source shared by all figures,
+    which are drawn with WebGL. The size of the output is bounded by the plot width,
+    independent of the number of snapshots.
     """
     output_dir, fname, name = cols_output(file_path)
 
+    planes = load_averages(file_path, processes=processes)
     if not columns:
         columns = ('aspect_ratio',)
     elif 'all' in columns:
-        columns = list(Flake().geometry().keys())
-        columns.pop(-2)         # remove 'iter' variable from 'all'
+        # only the columns stored in the file, older files e.g. have no `time`
+        columns = [col for col in planes[0][2].columns if col != 'iter' and
+                   all(col in mean_flake for _, _, mean_flake in planes)]
 
     logger.info("Generating columns:\t{}".format(columns))
     plot_cols = []
 
+    width = 1024
+    if decimated:
+        fields = ['iter'] + [col for col in columns if col != 'iter']
+        planes = [(plane, color,
+                   ColumnDataSource(decimate(mean_flake[fields], columns, width)))
+                  for plane, color, mean_flake in planes]
+
     for col in columns:
         figtitle = "{} ({})".format(name, col)
-        p = figure(title=figtitle, width=1024, height=768)
+        p = figure(title=figtitle, width=width, height=768,
+                   output_backend='webgl' if decimated else 'canvas')
         p.grid.grid_line_color = "white"
         p.background_fill_color = "#eeeeee"
 
-        for plane, color, mean_flake in averaged_planes(fname):
+        for plane, color, mean_flake in planes:
+            if decimated:
+                mscatter(p, 'iter', col, "circle", color, legend=plane,
+                         source=mean_flake)
+                continue
             Y = mean_flake[col]
             X = mean_flake['iter']
             mscatter(p, X, Y, "circle", color, legend=plane)
@@ -81,9 +127,52 @@ def mean_plot(file_path, *columns):
     show(bokeh_column(plot_cols))
 
 
-def averaged_planes(fname, choices=None):
+def cache_path(fname):
+    """ Return the path of the averages cache next to the HDF file `fname`. """
+    return path.splitext(fname)[0] + CACHE_EXT
+
+
+def load_averages(fname, choices=None, processes=1):
+    """ Return the list of `averaged_planes`, cached in a file next to the HDF file.
+
+    The cache is valid as long as path, size and modification time of the HDF file and
+    the `choices` are the same, otherwise the averages are calculated and cached again.
+    If the cache can not be written, e.g. next to a file in a read-only folder, the
+    averages are returned without it.
+    """
+    info = stat(fname)
+    key = (path.abspath(fname), info.st_size, info.st_mtime_ns,
+           sorted(choices) if choices else None)
+    cache = cache_path(fname)
+    try:
+        with open(cache, 'rb') as handler:
+            cached_key, averages = pickle.load(handler)
+        if cached_key == key:
+            logger.info("Averages loaded from {}".format(cache))
+            return averages
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+        pass
+
+    averages = list(averaged_planes(fname, choices, processes))
+    try:
+        with open(cache + '.part', 'wb') as handler:
+            pickle.dump((key, averages), handler, pickle.HIGHEST_PROTOCOL)
+        replace(cache + '.part', cache)
+    except OSError as e:
+        logger.warning("Averages not cached in {}: {}".format(cache, e))
+        if path.exists(cache + '.part'):
+            remove(cache + '.part')
+    return averages
+
+
+def averaged_planes(fname, choices=None, processes=1):
     """
     Extracts data from HDF file and averages over the flakes with same configuration.
+    The averages are read from the summary table, if the file has one (see `summary`).
+
+    With more than one of `processes` (None for all cores) and configurations, these are
+    averaged in a pool, each worker opening the file read-only, see `average_plane`.
+    The averages are yielded in the order of the configurations either way.
 
     TODO:
         * separate averaging from plotting
@@ -92,19 +181,37 @@ def averaged_planes(fname, choices=None):
           results
     """
     with pd.HDFStore(fname, 'r') as h5:
-        twins = [group for group in h5.root if HDF_METADATA not in str(group)]
+        twins = parameters(h5)['twins']
+        configs = configurations(h5)
         if choices:
-            twins = [x for i, x in enumerate(twins) if i in choices]
-        for index, twin, color in get_colors(twins):
-            tmp = []
-            for sample in twin:
-                loc = str(sample).split()[0]
-                flake = h5.select(loc)
-                tmp.append(flake)
-
-            flake_sum = pd.concat(tmp)
-            group_by_index = flake_sum.groupby(flake_sum.index)
-            mean_flake = group_by_index.mean()
-            plane = str(h5.select('/' + HDF_METADATA)['twins'][index]).replace(
-                'set', 'Twinplanes: ')
-            yield (plane, color, mean_flake)
+            configs = [x for i, x in enumerate(configs) if i in choices]
+        processes = min(processes or cpu_count() or 1, len(configs))
+        if processes <= 1:
+            means = [plane_means(h5, tp_idx) for tp_idx in configs]
+
+    if processes > 1:
+        with Pool(processes) as p:
+            means = p.map(average_plane, [(fname, tp_idx) for tp_idx in configs])
+
+    for (index, tp_idx, color), mean_flake in zip(get_colors(configs), means):
+        plane = str(twins[tp_idx]).replace('set', 'Twinplanes: ')
+        yield (plane, color, mean_flake)
+
+
+def plane_means(h5, tp_idx):
+    """ Return the mean over the samples of a configuration in an open HDF file.
+    """
+    if has_summary(h5):
+        return summary_means(h5, tp_idx)
+    flake_sum = configuration_samples(h5, tp_idx)
+    group_by_index = flake_sum.groupby(flake_sum.index)
+    return group_by_index.mean()
+
+
+def average_plane(task):
+    """ Open the HDF file of a (file name, twin index) task read-only and return the
+    `plane_means` of the configuration, the worker of `averaged_planes`.
+    """
+    fname, tp_idx = task
+    with pd.HDFStore(fname, 'r') as h5:
+        return plane_means(h5, tp_idx)
@@ -0,0 +1,89 @@
+""" Reproducible streams of random numbers for the growth.
+
+Each flake draws from its own `RandomStream`, seeded by a `numpy` seed sequence. A
+simulation derives the seeds of all its samples from a single root seed, hence any sample
+can be grown again exactly, and the streams of parallel samples are independent.
+"""
+from functools import partial
+import numpy as np
+
+
+class RandomStream():
+    """ Uniform random numbers in [0, 1) drawn in blocks from a `numpy` Generator.
+
+    The numbers are generated `buffer_size` at a time and handed out one by one by
+    `random()`, which has about the cost of `random.random`. The state of the stream is
+    the state of the generator at the start of the current block, along with the count of
+    numbers already taken from it.
+
+        Args:
+            seed (None, int or numpy.random.SeedSequence): Seed of the stream, by
+                default it is seeded from the system.
+            buffer_size (int): Number of random numbers drawn at once.
+    """
+    def __init__(self, seed=None, buffer_size=1024):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.buffer_size = buffer_size
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self._restart(0)
+
+    def __repr__(self):
+        return '{}(entropy={}, spawn_key={})'.format(
+            type(self).__name__, self.seed_sequence.entropy,
+            self.seed_sequence.spawn_key)
+
+    def __reduce__(self):
+        return type(self).from_state, (self.getstate(),)
+
+    def _blocks(self):
+        while True:
+            self._block_state = self.generator.bit_generator.state
+            self._block = iter(self.generator.random(self.buffer_size).tolist())
+            yield from self._block
+
+    def _restart(self, consumed):
+        """ Start a new block at the current state of the generator and skip the
+        `consumed` numbers of it.
+        """
+        self._block_state = self.generator.bit_generator.state
+        self._block = None
+        # `random()` is the bound `next` of the block iterator, to avoid a Python call
+        self.random = partial(next, self._blocks())
+        for _ in range(consumed):
+            self.random()
+
+    def getstate(self):
+        """ Return the state of the stream as tuple of builtin types.
+        """
+        consumed = 0
+        if self._block is not None:
+            consumed = self.buffer_size - self._block.__length_hint__()
+        seed = self.seed_sequence
+        return (seed.entropy, seed.spawn_key, seed.n_children_spawned, self.buffer_size,
+                self._block_state, consumed)
+
+    def setstate(self, state):
+        """ Restore the stream to a `state` of `getstate`.
+        """
+        entropy, spawn_key, spawned, self.buffer_size, block_state, consumed = state
+        self.seed_sequence = np.random.SeedSequence(entropy, spawn_key=spawn_key,
+                                                    n_children_spawned=spawned)
+        self.generator = np.random.Generator(np.random.PCG64(self.seed_sequence))
+        self.generator.bit_generator.state = block_state
+        self._restart(consumed)
+
+    @classmethod
+    def from_state(cls, state):
+        """ Create a stream from a `state` of `getstate`.
+        """
+        stream = cls.__new__(cls)
+        stream.setstate(state)
+        return stream
+
+    def spawn(self, n):
+        """ Return `n` independent streams, seeded by children of this seed sequence.
+        """
+        return [type(self)(seed, self.buffer_size)
+                for seed in self.seed_sequence.spawn(n)]
@@ -0,0 +1,97 @@
+""" Weighted choice of surface slots.
+
+The probabilistic growth chooses a slot proportional to the number of its sites times
+the attachment rate of a single site. Both only change slightly with each new atom, so we
+keep the weighted totals in a tree and only update the slots which changed.
+"""
+
+
+class SumTree():
+    """ Binary tree over a fixed number of non-negative weights.
+
+    Each node holds the sum of its two children, the leaves are the weights. Setting a
+    weight updates the path to the root and finding the position of a value on the
+    cumulative stack walks down from the root, both in O(log n). Parents are recomputed
+    from their children, hence the sums do not drift with many updates.
+
+        Args:
+            size (int): Number of weights.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.leaves = 1 << max(size - 1, 0).bit_length()
+        self.tree = [0.0] * (2 * self.leaves)
+
+    def __getitem__(self, index):
+        return self.tree[self.leaves + index]
+
+    def __setitem__(self, index, weight):
+        node = self.leaves + index
+        self.tree[node] = weight
+        node //= 2
+        while node:
+            self.tree[node] = self.tree[2*node] + self.tree[2*node + 1]
+            node //= 2
+
+    def total(self):
+        """ Return the sum of all weights. """
+        return self.tree[1]
+
+    def find(self, value):
+        """ Return the index where `value` lies on the stack of weights.
+
+        Empty branches are never entered, so as long as the total is positive the
+        returned index has a positive weight, even with rounding errors in `value`.
+        """
+        node = 1
+        while node < self.leaves:
+            left, right = self.tree[2*node], self.tree[2*node + 1]
+            if value < left or not right:
+                node = 2*node
+            else:
+                value -= left
+                node = 2*node + 1
+        return node - self.leaves
+
+
+class SlotSampler():
+    """ Draw surface slots proportional to their weight.
+
+    The weight of a slot is its number of sites times the rate of a single site. The
+    rates are evaluated once through `rate(slot)` and cached until `invalidate` is
+    called, e.g. when the temperature changes.
+
+        Args:
+            surface (list): The surface slots of a Flake.
+            rate (callable): Returns the rate of a single site in the given slot.
+    """
+    def __init__(self, surface, rate):
+        self.surface = surface
+        self.rate = rate
+        self.rates = None
+        self.tree = SumTree(len(surface))
+
+    def invalidate(self):
+        """ Drop the cached rates, they are recalculated on the next access. """
+        self.rates = None
+
+    def refresh(self):
+        """ Recalculate all rates and weights. """
+        self.rates = [self.rate(slot) for slot in range(len(self.surface))]
+        for slot in range(len(self.surface)):
+            self.update(slot)
+
+    def update(self, slot):
+        """ Update the weight of `slot` after its size changed. """
+        if self.rates is not None:
+            self.tree[slot] = len(self.surface[slot]) * self.rates[slot]
+
+    def total(self):
+        """ Return the sum of all weights. """
+        if self.rates is None:
+            self.refresh()
+        return self.tree.total()
+
+    def draw(self, rand):
+        """ Return a slot for the relative position `rand` in [0, 1). """
+        return self.tree.find(rand * self.total())
@@ -36,7 +36,15 @@ TIMING_OUTPUT = path.join(FLAME_OUTPUT, 'timing')
 
 PICKLE_EXT = '.flm'
 HDF_EXT = '.h5'
+NPZ_EXT = '.npz'
+MANIFEST_EXT = '.manifest'
+CACHE_EXT = '.cache'
+STATS_EXT = '.stats'
 HDF_METADATA = 'parameters'
+HDF_TABLE = 'flakes'
+HDF_TABLE_COLUMNS = ['twin_idx', 'sample_idx', 'iter']
+HDF_SUMMARY = 'summary'
+SUMMARY_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
 PARAMS_YAML = 'sim_params.yaml'
 
 """ This is the maximum distance between two atoms to be considered nearest neighbors.
@@ -81,11 +89,37 @@ sample_size: {SMPSIZE}
 snapshot_interval: {SNAPSHOT}
     # End size of the flake in atoms
 total_size: {TOTAL_SIZE}
+    # HDF layout: 'table' appends all snapshots to a single table, 'legacy' writes
+    # one node per flake
+layout: 'table'
+    # Atoms grown between checkpoints of each flake, to resume an interrupted run
+    # with `flame run --resume <file>` (null for no checkpoints)
+checkpoint_interval: null
+    # Atoms grown once per twin plane configuration and shared by all its samples,
+    # which continue from a fork of this flake (null to grow each sample from the seed)
+prefix_size: null
+    # Root seed of the random numbers, each sample gets its own child seed (null to
+    # draw one, it is stored with the results to grow any sample again)
+rng_seed: null
+    # Keep the snapshots of every sample in the HDF file, otherwise only the summary
+    # statistics, accumulated while the samples arrive, are written
+keep_raw: true
 
     # These options are passed to growth.Flake() instances.
 flake:
     temp: {FLAKE_TEMP}
-    seed: '{FLAKE_SEED}'\
+    seed: '{FLAKE_SEED}'
+
+    # Worker pool of the simulation. Number of processes (null for all cores),
+    # number of samples handed to a worker at once, maximum number of samples in
+    # flight (null for twice the cores), samples written between file flushes and
+    # seconds between saves of the summary statistics.
+pool:
+    processes: null
+    chunksize: 1
+    max_inflight: null
+    flush_interval: 10
+    stats_interval: 60\
 """
     rendered = skeleton.format(
                     **gen_params(time=get_time(), name=project_name))
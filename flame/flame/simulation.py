@@ -1,12 +1,22 @@
 import sys
+import pickle
 import logging
+import numpy as np
 import pandas as pd
+from queue import Queue
 from random import random
-from os import getcwd, path
+from os import getcwd, path, cpu_count, makedirs, remove, replace
 from multiprocessing import Pool
+from shutil import rmtree
+from time import monotonic
 
 from flame.growth import Flake
-from flame.settings import HDF_EXT, PARAMS_YAML, get_time, get_skel, get_params
+from flame.rng import RandomStream
+from flame.stats import Accumulator
+from flame.summary import layout, parameters, put_summary, write_summary
+from flame.settings import (HDF_EXT, HDF_METADATA, HDF_TABLE, HDF_TABLE_COLUMNS,
+                            MANIFEST_EXT, PICKLE_EXT, PARAMS_YAML, STATS_EXT, get_time,
+                            get_skel, get_params)
 
 logger = logging.getLogger(__name__)
 
@@ -39,11 +49,258 @@ def tp_gen(params):
     return [set(x) for x in mapping]
 
 
-def growth_sample(twin, params):
-    return pd.DataFrame(builder(twin, **params))
+def growth_sample(task):
+    """ Grow a single sample of a task from `tasks` and return its indices and data.
 
+    If a `checkpoint_interval` is given, the flake is periodically saved to its
+    checkpoint file and resumed from there, see `builder`.
+    """
+    tp_idx, sample_idx, twin, params = task
+    checkpoint = None
+    if params.get('checkpoint_interval'):
+        checkpoint = checkpoint_path(params['identifier'], tp_idx, sample_idx)
+    sample = pd.DataFrame(builder(twin, checkpoint=checkpoint,
+                                  rng=sample_seed(params, tp_idx, sample_idx), **params))
+    if checkpoint and path.isfile(checkpoint):
+        remove(checkpoint)
+    return tp_idx, sample_idx, sample
+
+
+def growth_chunk(chunk):
+    """ Grow all samples of a chunk of tasks, see `growth_sample`.
+    """
+    return [growth_sample(task) for task in chunk]
+
+
+def growth_prefix(task):
+    """ Grow the shared prefix flake of a twin plane configuration.
+
+    The flake is grown in steps of `snapshot_interval` up to `prefix_size` atoms.
+    Returns the twin index and the prefix for `builder`, the state of the flake as
+    arrays and its snapshots.
+    """
+    tp_idx, twin, params = task
+    xargs = dict(params.get('flake') or {})
+    xargs.setdefault('rng', sample_seed(params, tp_idx))
+    flake = Flake(*twin, **xargs)
+    snapshots = []
+    while flake.iter < min(params['prefix_size'], params['total_size']):
+        flake.grow(params['snapshot_interval'])
+        snapshots.append(flake.geometry())
+    return tp_idx, (flake.to_arrays(), snapshots)
+
+
+def sample_seed(params, *key):
+    """ Return the seed sequence of a sample of the run with `params`.
+
+    The root seed `rng_seed` of the run spawns a child per twin plane configuration,
+    which seeds its prefix, and each of those spawns a child per sample. Their `key` is
+    (twin index, sample index) for a sample and (twin index,) for a prefix. Without a
+    root seed None is returned, i.e. the sample is seeded from the system.
+    """
+    if params.get('rng_seed') is None:
+        return None
+    return np.random.SeedSequence(params['rng_seed'], spawn_key=key)
+
+
+def tasks(twins, params, prefixes=None):
+    """ Return all (twin index, sample index, twin, params) tasks of the sweep.
+
+    With `prefixes`, a mapping of twin index to the result of `growth_prefix`, the
+    samples of a twin plane configuration get its `prefix` in their params.
+    """
+    prefixes = prefixes or {}
+    return [(tp_idx, sample_idx, twin,
+             dict(params, prefix=prefixes[tp_idx]) if tp_idx in prefixes else params)
+            for tp_idx, twin in enumerate(twins)
+            for sample_idx in range(params['sample_size'])]
+
+
+def bounded_results(pool, todo, chunksize=1, max_inflight=None):
+    """ Yield the results of `growth_sample` over `todo` in order of completion.
+
+    Tasks are submitted to the `pool` in chunks of `chunksize`. At most `max_inflight`
+    results are submitted but not yet consumed, further tasks are only submitted when the
+    consumer catches up. This applies backpressure to the workers and bounds the memory
+    held in the parent process. Exceptions of the workers are raised here.
+
+    When a chunk fails or the consumer stops early, no further tasks are submitted and
+    the chunks in flight are waited for, since terminating a pool with queued tasks
+    can hang.
+    """
+    done = Queue()
+    if not max_inflight:
+        max_inflight = 2 * cpu_count()
+    max_chunks = max(max_inflight // chunksize, 1)
+    chunks = (todo[i:i + chunksize] for i in range(0, len(todo), chunksize))
+
+    pending = 0
+    try:
+        for chunk in chunks:
+            if pending >= max_chunks:
+                pending -= 1
+                yield from _collect(done)
+            pool.apply_async(growth_chunk, (chunk,), callback=done.put,
+                             error_callback=done.put)
+            pending += 1
+        while pending:
+            pending -= 1
+            yield from _collect(done)
+    finally:
+        for _ in range(pending):
+            done.get()
+
+
+def _collect(done):
+    """ Return the results of the next finished chunk, raise if it failed. """
+    results = done.get()
+    if isinstance(results, BaseException):
+        raise results
+    return results
+
+
+class SampleWriter():
+    """ Writer stage, appending each finished sample to the HDF store.
+
+    In the `table` layout all snapshots are appended to the single `HDF_TABLE` table,
+    along with the `twin_idx` and `sample_idx` of their flake. Those and `iter` are
+    indexed data columns, so a configuration is selected with a single query. In the
+    `legacy` layout each sample is put in its own `twinplaneNN/flakeNNN` node.
+
+    Each sample is also folded into the `accumulator`, see `stats.Accumulator`. Without
+    `keep_raw` only the accumulator is fed and the snapshots are not written.
+
+    The store is flushed to disk every `flush_interval` samples, such that a crashed run
+    keeps all but the last few samples, which are then recorded in the `manifest`.
+    Pickling the accumulator takes a while for large sweeps, so it is saved to its
+    `stats` file at most every `stats_interval` seconds and with the `final` flush.
+
+        Args:
+            h5 (HDFStore): The open store to write to.
+            flush_interval (int): Samples written between flushes.
+            layout (str): Either `table` or `legacy`.
+            manifest (str): File of the completed samples, see `read_manifest`.
+            accumulator (Accumulator): Statistics of the samples.
+            keep_raw (bool): Write the snapshots of each sample.
+            stats (str): File the accumulator is saved to, see `stats_path`.
+            stats_interval (float): Seconds between saves of the accumulator.
+    """
+    def __init__(self, h5, flush_interval=10, layout='table', manifest=None,
+                 accumulator=None, keep_raw=True, stats=None, stats_interval=60):
+        if layout not in ('table', 'legacy'):
+            raise ValueError("Unknown HDF layout: {}".format(layout))
+        self.h5 = h5
+        self.flush_interval = flush_interval
+        self.layout = layout
+        self.manifest = manifest
+        self.accumulator = accumulator
+        self.keep_raw = keep_raw
+        self.stats = stats
+        self.stats_interval = stats_interval
+        self.saved = monotonic()
+        self.pending = []
+        self.written = 0
+
+    def write(self, tp_idx, sample_idx, sample):
+        if self.accumulator is not None:
+            self.accumulator.add(tp_idx, sample_idx, sample)
+        if self.keep_raw and self.layout == 'table':
+            sample = sample.assign(twin_idx=tp_idx, sample_idx=sample_idx)
+            self.h5.append(HDF_TABLE, sample, format='table',
+                           data_columns=HDF_TABLE_COLUMNS)
+        elif self.keep_raw:
+            location = 'twinplane{:02}/flake{:03}'.format(tp_idx, sample_idx)
+            self.h5.put(location, sample)
+        self.written += 1
+        self.pending.append((tp_idx, sample_idx))
+        if self.written % self.flush_interval == 0:
+            self.flush()
+
+    def flush(self, final=False):
+        """ Flush the store, then record the flushed samples in the `manifest`.
+
+        The accumulator is saved with a `final` flush or once `stats_interval` seconds
+        passed since its last save.
+        """
+        self.h5.flush()
+        if self.accumulator is not None and self.stats and (
+                final or monotonic() - self.saved >= self.stats_interval):
+            self.accumulator.save(self.stats)
+            self.saved = monotonic()
+        if self.manifest and self.pending:
+            with open(self.manifest, 'a') as handler:
+                handler.writelines('{} {}\n'.format(*task) for task in self.pending)
+        self.pending = []
+
+
+def manifest_path(fname):
+    """ Return the path of the run manifest next to the HDF file `fname`. """
+    return path.splitext(fname)[0] + MANIFEST_EXT
+
+
+def stats_path(fname):
+    """ Return the path of the saved accumulator next to the HDF file `fname`. """
+    return path.splitext(fname)[0] + STATS_EXT
 
-def run(params=None):
+
+def load_stats(fname):
+    """ Return the accumulator saved next to the HDF file `fname`, a new one if there
+    is none.
+    """
+    try:
+        return Accumulator.load(stats_path(fname))
+    except IOError:
+        return Accumulator()
+
+
+def read_manifest(fname):
+    """ Return the set of (twin index, sample index) tasks completed in `fname`. """
+    try:
+        with open(manifest_path(fname)) as handler:
+            return set(tuple(int(x) for x in line.split()) for line in handler
+                       if line.strip())
+    except IOError:
+        return set()
+
+
+def checkpoint_folder(identifier):
+    """ Return the folder of the checkpoint files of a run. """
+    return identifier + '_checkpoints'
+
+
+def checkpoint_path(identifier, tp_idx, sample_idx):
+    """ Return the checkpoint file of a sample in the checkpoint folder of the run. """
+    folder = checkpoint_folder(identifier)
+    makedirs(folder, exist_ok=True)
+    name = 'twinplane{:02}_flake{:03}{}'.format(tp_idx, sample_idx, PICKLE_EXT)
+    return path.join(folder, name)
+
+
+def stored_sample(h5, tp_idx, sample_idx):
+    """ Return the snapshots of a sample as written by the `SampleWriter`.
+    """
+    if layout(h5) == 'table':
+        where = 'twin_idx == {} & sample_idx == {}'.format(tp_idx, sample_idx)
+        selected = h5.select(HDF_TABLE, where=where)
+        return selected.drop(columns=['twin_idx', 'sample_idx'])
+    return h5.select('twinplane{:02}/flake{:03}'.format(tp_idx, sample_idx))
+
+
+def drop_incomplete(h5, done):
+    """ Remove rows of samples which are not in the set of `done` tasks.
+
+    Only needed in the `table` layout, where a sample is appended and would be
+    duplicated when run again. Legacy nodes are simply overwritten.
+    """
+    if '/' + HDF_TABLE not in h5.keys():
+        return
+    written = h5.select(HDF_TABLE, columns=['twin_idx', 'sample_idx'])
+    for tp_idx, sample_idx in set(map(tuple, written.values.tolist())) - done:
+        h5.remove(HDF_TABLE, where='twin_idx == {} & sample_idx == {}'.format(
+            tp_idx, sample_idx))
+
+
+def run(params=None, resume=None):
     """ Spawn HDF file and create basic structure for the experiment.
 
     The `identifier` is composed from the name and a random hash value to
@@ -53,65 +310,238 @@ def run(params=None):
     * create a mapping through lambda evaluation
     * generate twin plane configuration for each value
 
-    New runners function:
+    All samples of all twin plane configurations are fed into a single worker pool, the
+    number of `processes` and the `chunksize` are read from the `pool` parameters. Each
+    sample is written to disk by the `SampleWriter` as soon as it is completed, in
+    whichever order. With `max_inflight` and `flush_interval` in the `pool` parameters
+    the number of samples held in memory and the flushing of the file are controlled.
+    The `layout` parameter chooses the structure of the HDF file, see `SampleWriter`,
+    `table` by default.
+
+    With a `prefix_size` each twin plane configuration is grown once to this size, all
+    its samples continue from independent forks of this flake, see `growth_prefix`.
 
-    * with pandas
-    * meta attributes
-    * proper loops
+    Every sample is grown with its own random number stream, derived from the root seed
+    `rng_seed` by `sample_seed`. A missing root seed is drawn from the system and stored
+    with the parameters, such that each sample can be grown again with `regenerate`.
+
+    Each sample is folded into running statistics as it arrives, see `stats`. At the end
+    a summary table is written, see `summary`, with exact quantiles of the stored
+    snapshots. With `keep_raw` set to false the snapshots of the samples are not written
+    at all, the summary is taken from the running statistics and its quantiles are
+    estimates. Runs split into shards are combined with `merge_shards`.
+
+    Completed samples are recorded in a manifest next to the HDF file. A run which was
+    interrupted is continued by passing its HDF file as `resume`: the parameters are
+    read from the file and only the samples missing in the manifest are scheduled. With
+    a `checkpoint_interval` those also continue from their last checkpoint, the folder of
+    the checkpoints is removed once all samples are written. The statistics are saved
+    less often than the manifest, see `SampleWriter`. Samples missing in them are folded
+    in again from the stored snapshots, or grown again without `keep_raw`.
     """
-    if not params:
-        params = get_params()
-    identifier = params['name'] + '_' + hex(hash(random()))
-    fname = identifier + HDF_EXT
+    if resume:
+        fname = resume
+        with pd.HDFStore(fname, 'r') as h5:
+            params = parameters(h5)
+        # runs which did not store their layout wrote the legacy one
+        params.setdefault('layout', 'legacy')
+        identifier = params.get('identifier', path.splitext(path.basename(fname))[0])
+        params['identifier'] = identifier
+        twins = params['twins']
+        done = read_manifest(fname)
+        accumulator = load_stats(fname)
+        if not params.get('keep_raw', True):
+            # the statistics are all there is, samples saved after them are grown again
+            done, rebuild = accumulator.done, set()
+        else:
+            if not accumulator.done <= done:
+                logger.warning('Statistics of {} are ahead of its manifest, they are '
+                               'taken from the stored samples'.format(fname))
+                accumulator = Accumulator()
+            rebuild = done - accumulator.done
+    else:
+        if not params:
+            params = get_params()
+        identifier = params['name'] + '_' + hex(hash(random()))
+        fname = identifier + HDF_EXT
+        params['identifier'] = identifier
+        params['twins'] = twins = tp_gen(params)
+        params.setdefault('layout', 'table')
+        if params.get('rng_seed') is None:
+            params['rng_seed'] = np.random.SeedSequence().entropy
+        accumulator = Accumulator()
+        done = rebuild = set()
 
     logger.info('STARTED >>> {} @ {}'.format(identifier, ' :: '.join(get_time())))
     for k, v in params.items():
         logger.info('\t\t{}: {}'.format(k, v))
 
-    params['twins'] = twins = tp_gen(params)
+    pool = params.get('pool') or {}
+    todo = [task for task in tasks(twins, params) if task[:2] not in done]
+    if resume:
+        logger.info('Resuming {}: {} samples done, {} to go'.format(
+            fname, len(done), len(todo)))
 
-    with pd.HDFStore(fname, title=identifier) as h5:
-        h5.put('/parameters', pd.Series(str(params)))
+    with pd.HDFStore(fname, 'a', title=identifier) as h5:
+        if resume:
+            drop_incomplete(h5, done)
+            for task in sorted(rebuild):
+                accumulator.add(*task, stored_sample(h5, *task))
+        else:
+            h5.put('/parameters', pd.Series(str(params)))
 
-        for tp_idx, twin in enumerate(twins):
-            twin_loc = 'twinplane{:02}'.format(tp_idx)
-            logger.info('F>> TP: {tp}  Samples:{sm}  @{tm}  Total Size: {sz}'.format(
+        for twin in twins:
+            logger.info('F>> TP: {tp}  Samples:{sm}  Total Size: {sz}'.format(
                 tp=twin,
                 sm=params['sample_size'],
-                tm=get_time()[1],
                 sz=params['total_size']))
 
-            # here comes the data crunching
-            args = ((twin, params) for _ in range(params['sample_size']))
-            with Pool() as p:
-                samples = p.starmap(growth_sample, args)
-
-            # and the storage on to disk
-            for idx, sample in enumerate(samples):
-                flake_loc = 'flake{:03}'.format(idx)
-                location = "/".join((twin_loc, flake_loc))
-                h5.put(location, sample)
+        # here comes the data crunching, and the storage on to disk
+        writer = SampleWriter(h5, pool.get('flush_interval') or 10,
+                              params['layout'], manifest_path(fname),
+                              accumulator, params.get('keep_raw', True),
+                              stats_path(fname), pool.get('stats_interval') or 60)
+        with Pool(pool.get('processes')) as p:
+            if params.get('prefix_size') and todo:
+                pending = sorted(set(task[0] for task in todo))
+                prefixes = dict(p.map(growth_prefix, [(tp_idx, twins[tp_idx], params)
+                                                      for tp_idx in pending]))
+                todo = [task for task in tasks(twins, params, prefixes)
+                        if task[:2] not in done]
+            results = bounded_results(p, todo, pool.get('chunksize') or 1,
+                                      pool.get('max_inflight'))
+            try:
+                for tp_idx, sample_idx, sample in results:
+                    writer.write(tp_idx, sample_idx, sample)
+                    logger.info('D>> TP: {tp}  Sample:{sm}  @{tm}'.format(
+                        tp=twins[tp_idx], sm=sample_idx, tm=get_time()[1]))
+            finally:
+                results.close()         # waits for the tasks in flight on errors
+            p.close()
+            p.join()
+        writer.flush(final=True)
+        if params.get('keep_raw', True):
+            write_summary(h5)
+        else:
+            put_summary(h5, accumulator.summary())
 
+    if path.isdir(checkpoint_folder(identifier)):
+        rmtree(checkpoint_folder(identifier))
     logger.info('ENDED >>> {} @ {}'.format(identifier, ' :: '.join(get_time())))
 
 
-def builder(tp, total_size=10000, snapshot_interval=1000, **kwargs):
+def merge_shards(fname, *shards):
+    """ Merge the statistics of runs split into several `shards` into the HDF file
+    `fname`.
+
+    All shards must sweep the same twin plane configurations with different `rng_seed`,
+    otherwise they would hold the same samples. Their accumulators are merged, see
+    `stats_path`, and written as summary table with estimated quantiles along with the
+    parameters of the first shard. The merged accumulator is saved next to `fname`, such
+    that it can be merged again.
+    """
+    accumulator = Accumulator()
+    merged = None
+    seeds = {}
+    for shard in shards:
+        with pd.HDFStore(shard, 'r') as h5:
+            params = parameters(h5)
+        if merged is None:
+            merged = dict(params, shards=[path.basename(x) for x in shards])
+        elif params['twins'] != merged['twins']:
+            raise ValueError("Shard {} has different twin planes.".format(shard))
+        seed = params.get('rng_seed')
+        if seed is not None and seed in seeds:
+            raise ValueError("Shards {} and {} have the same random seed.".format(
+                seeds[seed], shard))
+        seeds[seed] = shard
+        accumulator.merge(Accumulator.load(stats_path(shard)))
+
+    with pd.HDFStore(fname, 'w') as h5:
+        h5.put(HDF_METADATA, pd.Series(str(merged)))
+        put_summary(h5, accumulator.summary())
+    accumulator.save(stats_path(fname))
+    logger.info('Merged {} shards into {}'.format(len(shards), fname))
+    return accumulator
+
+
+def regenerate(fname, tp_idx, sample_idx):
+    """ Grow a sample of the run stored in the HDF file `fname` again.
+
+    The sample is grown from its seed, see `sample_seed`, and returned as DataFrame like
+    it was written by `run`.
+    """
+    with pd.HDFStore(fname, 'r') as h5:
+        params = parameters(h5)
+    if params.get('rng_seed') is None:
+        raise ValueError("No random seed stored in {}".format(fname))
+    params.pop('name', None)                # do not export the coordinates again
+    twin = params['twins'][tp_idx]
+    prefix = None
+    if params.get('prefix_size'):
+        _, prefix = growth_prefix((tp_idx, twin, params))
+    return pd.DataFrame(builder(twin, prefix=prefix,
+                                rng=sample_seed(params, tp_idx, sample_idx), **params))
+
+
+def builder(tp, total_size=10000, snapshot_interval=1000, checkpoint=None,
+            checkpoint_interval=None, prefix=None, rng=None, **kwargs):
     """ Create generator that yields the geometry of growing Flake.
 
     Generate a `Flake` instance from the `growth` module. By consuming an item we grow
     the flake by the amount in `snapshot_interval` and yield the output of our
     `geometry` method.
+
+    With a `checkpoint` file the flake and its snapshots so far are pickled there
+    every `checkpoint_interval` atoms. If the file already exists, the growth continues
+    from there, after yielding the stored snapshots again.
+
+    A `prefix` from `growth_prefix` starts the growth from a pre-grown flake instead of
+    the seed. Its snapshots are yielded first, then a copy of the flake continues with
+    its own random number stream, seeded by `rng`, see `Flake`.
     """
     try:
         xargs = kwargs['flake']
     except KeyError:
         xargs = {'': None}
+    if rng is not None:
+        xargs = dict(xargs, rng=rng)
 
-    thisFlake = Flake(*tp, **xargs)
+    snapshots = []
+    if checkpoint and path.isfile(checkpoint):
+        with open(checkpoint, 'rb') as handler:
+            thisFlake, snapshots = pickle.load(handler)
+        logger.info('Resumed {} at {} atoms'.format(checkpoint, thisFlake.iter))
+        for snapshot in snapshots:
+            yield snapshot
+    elif prefix:
+        state, snapshots = prefix
+        thisFlake = Flake.from_arrays(state, rng=RandomStream(rng))
+        snapshots = list(snapshots)
+        for snapshot in snapshots:
+            yield snapshot
+    else:
+        thisFlake = Flake(*tp, **xargs)
+    saved = thisFlake.iter
 
     while thisFlake.iter < total_size:
         thisFlake.grow(snapshot_interval)
-        yield thisFlake.geometry()
+        snapshot = thisFlake.geometry()
+        if checkpoint:
+            snapshots.append(snapshot)
+            if thisFlake.iter - saved >= (checkpoint_interval or 0):
+                save_checkpoint(checkpoint, thisFlake, snapshots)
+                saved = thisFlake.iter
+        yield snapshot
     if 'name' in kwargs:
         thisFlake.carve()
         thisFlake.export_coordinates(kwargs['name'])
+
+
+def save_checkpoint(checkpoint, flake, snapshots):
+    """ Pickle the flake and its snapshots, replacing the checkpoint file at once.
+    """
+    partial = checkpoint + '.part'
+    with open(partial, 'wb') as handler:
+        pickle.dump((flake, snapshots), handler, pickle.HIGHEST_PROTOCOL)
+    replace(partial, checkpoint)
@@ -0,0 +1,212 @@
+""" Statistics of the snapshots, accumulated while a simulation runs.
+
+Instead of keeping every snapshot of every sample to average them afterwards, each
+sample is folded into running statistics as soon as it arrives. Mean and variance are
+updated with Welford's algorithm, quantiles are estimated by a sketch of logarithmic
+buckets. All of them can be merged, such that runs split into separate shards are
+combined into the same statistics. The samples of a run are folded in by the process
+which writes them, so the workers do not keep statistics of their own.
+
+Only the quantiles differ from those of `summary.summarize`: instead of interpolating
+between samples, the value at the lower rank is estimated within the relative accuracy
+of the sketch (1% by default). Runs which keep their samples therefore summarize them
+exactly, see `simulation.run`.
+"""
+import pickle
+from math import ceil, isnan, log, nan, sqrt
+from os import replace
+
+import pandas as pd
+
+from flame.settings import SUMMARY_QUANTILES
+
+
+class RunningStats():
+    """ Count, mean and variance of a stream of values.
+
+    The mean and the sum of squared deviations `m2` are updated with each value
+    (Welford). Two instances are merged with the pairwise update of Chan et al. NaN
+    values are skipped, like in `pandas`.
+    """
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value):
+        """ Add a single value. """
+        if isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """ Add all values of `other`. """
+        count = self.count + other.count
+        if not other.count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def std(self):
+        """ Sample standard deviation, NaN for less than two values. """
+        if self.count < 2:
+            return nan
+        return sqrt(self.m2 / (self.count - 1))
+
+
+class QuantileSketch():
+    """ Mergeable sketch of the distribution of a stream of values.
+
+    Each value is counted in a bucket of logarithmic width, such that every quantile is
+    returned with a relative error of at most `alpha` (DDSketch). Merging two sketches
+    with the same `alpha` adds up their buckets.
+
+        Args:
+            alpha (float): Relative accuracy of the quantiles.
+    """
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _bucket(self, value):
+        return ceil(log(value) / self.log_gamma)
+
+    def push(self, value):
+        """ Add a single value, NaN values are skipped. """
+        if isnan(value):
+            return
+        if value > 0:
+            key = self._bucket(value)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = self._bucket(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zeros += 1
+        self.count += 1
+
+    def merge(self, other):
+        """ Add all values of `other`, which needs the same accuracy. """
+        if other.alpha != self.alpha:
+            raise ValueError("Sketches of different accuracy can not be merged.")
+        for mine, theirs in ((self.positive, other.positive),
+                             (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """ Return the estimated `q` quantile, NaN if there are no values.
+
+        This is the value at rank `q * (count - 1)`, rounded down, without interpolating
+        between neighbouring values.
+        """
+        if not self.count:
+            return nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+
+class Accumulator():
+    """ Running statistics of all columns for each twin plane configuration and `iter`.
+
+    Samples are folded in with `add`, accumulators of shards are combined with `merge`.
+    `summary` returns the same table as `summary.summarize`, with estimated quantiles.
+
+        Args:
+            quantiles (tuple): Quantiles of the summary.
+            alpha (float): Relative accuracy of the quantiles, see `QuantileSketch`.
+    """
+    def __init__(self, quantiles=SUMMARY_QUANTILES, alpha=0.01):
+        self.quantiles = quantiles
+        self.alpha = alpha
+        self.columns = []
+        self.groups = {}
+        self.done = set()
+
+    def add(self, tp_idx, sample_idx, sample):
+        """ Fold the snapshots of a sample into the statistics. """
+        if not self.columns:
+            self.columns = [col for col in sample.columns if col != 'iter']
+        for row in sample.to_dict('records'):
+            key = (tp_idx, row['iter'])
+            try:
+                group = self.groups[key]
+            except KeyError:
+                group = self.groups[key] = {
+                    col: (RunningStats(), QuantileSketch(self.alpha))
+                    for col in self.columns}
+            for col, (running, sketch) in group.items():
+                running.push(row[col])
+                sketch.push(row[col])
+        self.done.add((tp_idx, sample_idx))
+
+    def merge(self, other):
+        """ Add all statistics of `other`. """
+        if not self.columns:
+            self.columns = other.columns
+        for key, theirs in other.groups.items():
+            group = self.groups.setdefault(key, {
+                col: (RunningStats(), QuantileSketch(self.alpha))
+                for col in self.columns})
+            for col, (running, sketch) in theirs.items():
+                group[col][0].merge(running)
+                group[col][1].merge(sketch)
+        self.done |= other.done
+
+    def summary(self):
+        """ Return the statistics as DataFrame, one row per configuration and `iter`.
+        """
+        rows = []
+        for (tp_idx, iteration), group in sorted(self.groups.items()):
+            row = {'twin_idx': tp_idx, 'iter': iteration,
+                   'count': max(running.count for running, _ in group.values())}
+            row.update(('{}_mean'.format(col), group[col][0].mean)
+                       for col in self.columns)
+            row.update(('{}_std'.format(col), group[col][0].std) for col in self.columns)
+            for q in self.quantiles:
+                row.update(('{}_q{:g}'.format(col, 100 * q), group[col][1].quantile(q))
+                           for col in self.columns)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def save(self, fname):
+        """ Pickle the accumulator, replacing `fname` at once. """
+        with open(fname + '.part', 'wb') as handler:
+            pickle.dump(self, handler, pickle.HIGHEST_PROTOCOL)
+        replace(fname + '.part', fname)
+
+    @staticmethod
+    def load(fname):
+        """ Return the accumulator pickled in `fname`. """
+        with open(fname, 'rb') as handler:
+            return pickle.load(handler)
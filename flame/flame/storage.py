@@ -0,0 +1,523 @@
+""" Containers for the lattice sites of a Flake.
+
+The growth picks a random site from a surface slot at every step. Python sets do not
+support random access, so here we keep containers which do.
+
+Large flakes are memory bound by the Python tuples of their sites. The `packed` backend
+therefore stores each index (i, j, k) as a single 64 bit integer in compact arrays, while
+still handing out tuples to the rest of the program. This takes four to five times less
+memory per atom, but every lookup probes its table in Python, which makes the growth
+about seven times slower than with sets. The `chunked` backend keeps the atoms as bitmaps
+in blocks of the lattice, allocated as the flake grows into them.
+"""
+from array import array
+from collections.abc import MutableSet, MutableMapping
+from itertools import chain
+
+import numpy as np
+
+""" Bits per packed index component, components are in [-2**20, 2**20).
+"""
+PACK_BITS = 21
+PACK_OFFSET = 1 << (PACK_BITS - 1)
+PACK_MASK = (1 << PACK_BITS) - 1
+
+
+def pack(site):
+    """ Return the integer key of the index tuple `site`. """
+    i, j, k = site
+    return ((i + PACK_OFFSET) << 2*PACK_BITS | (j + PACK_OFFSET) << PACK_BITS |
+            (k + PACK_OFFSET))
+
+
+def unpack(key):
+    """ Return the index tuple of the integer `key`. """
+    return ((key >> 2*PACK_BITS) - PACK_OFFSET,
+            (key >> PACK_BITS & PACK_MASK) - PACK_OFFSET,
+            (key & PACK_MASK) - PACK_OFFSET)
+
+
+def pack_array(sites):
+    """ Return the integer keys of an (N, 3) array of indices. """
+    sites = np.asarray(sites, dtype=np.int64).reshape(-1, 3) + PACK_OFFSET
+    return sites[:, 0] << 2*PACK_BITS | sites[:, 1] << PACK_BITS | sites[:, 2]
+
+
+def unpack_array(keys):
+    """ Return the (N, 3) array of indices of integer `keys`. """
+    keys = np.asarray(keys, dtype=np.int64)
+    return np.stack((keys >> 2*PACK_BITS,
+                     keys >> PACK_BITS & PACK_MASK,
+                     keys & PACK_MASK), axis=-1) - PACK_OFFSET
+
+
+def site_array(sites):
+    """ Return the sites of any container as an (N, 3) integer array. """
+    if isinstance(sites, np.ndarray):
+        return sites.astype(np.int64, copy=False).reshape(-1, 3)
+    try:
+        return sites.array()
+    except AttributeError:
+        return np.fromiter(chain.from_iterable(sites), dtype=np.int64).reshape(-1, 3)
+
+
+def unique_keys(keys):
+    """ Return the distinct integer `keys` in ascending order.
+
+    Same as `np.unique`, but sorting is much faster than hashing for large arrays of
+    packed sites.
+    """
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+
+def boundary_sites(sites):
+    """ Iterate over the sites of a container, skipping those deep inside if possible.
+
+    Only the `chunked` backend knows about interior blocks, all others yield every site.
+    """
+    try:
+        return sites.boundary()
+    except AttributeError:
+        return iter(sites)
+
+
+def boundary_array(sites):
+    """ Return the sites of a container as (N, 3) integer array, skipping those deep
+    inside if possible, see `boundary_sites`.
+    """
+    if hasattr(sites, 'boundary'):
+        return sites.array(skip_interior=True)
+    return site_array(sites)
+
+
+class IndexedSet(MutableSet):
+    """ Set with random access to its elements.
+
+    The elements are kept densely in the `items` list, while `position` maps each element
+    to its index in there. Removing an element swaps the last one into the freed place,
+    so adding, removing and picking a random element are all O(1).
+
+        Args:
+            iterable: Optional elements to start with.
+    """
+    __slots__ = ('items', 'position')
+
+    def __init__(self, iterable=()):
+        self.items = []
+        self.position = {}
+        for item in iterable:
+            self.add(item)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.items)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        """ Append `item` to the dense list, if not yet present. """
+        if item not in self.position:
+            self.position[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        """ Remove `item` by moving the last element into its place. """
+        index = self.position.pop(item, None)
+        if index is None:
+            return
+        last = self.items.pop()
+        if index < len(self.items):
+            self.items[index] = last
+            self.position[last] = index
+
+    def pick(self, rand):
+        """ Return the element at the relative position `rand` in [0, 1). """
+        return self.items[int(rand*len(self.items))]
+
+
+class PackedTable():
+    """ Open addressing hash table of packed site keys.
+
+    Keys and values are stored in flat arrays of 64 bit integers with linear probing.
+    Deleted entries are marked until the next resize, which happens when more than
+    `MAX_LOAD` of the table is filled.
+
+        Args:
+            values (bool): Whether to store a value for each key, else it is a set.
+    """
+    EMPTY = -1
+    DELETED = -2
+    MAX_LOAD = 0.6
+
+    def __init__(self, values=True, capacity=64):
+        self.with_values = values
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.keys = array('q', [self.EMPTY]) * capacity
+        self.values = array('q', [0]) * capacity if self.with_values else None
+        self.shift = 64 - (capacity.bit_length() - 1)
+        self.mask = capacity - 1
+        self.used = 0           # live entries
+        self.filled = 0         # live and deleted entries
+
+    def __len__(self):
+        return self.used
+
+    def __contains__(self, key):
+        return self.keys[self._probe(key)] == key
+
+    def _probe(self, key):
+        """ Return the position of `key` or of the free position to insert it.
+
+        The start position is taken from the upper bits of a Fibonacci hash.
+        """
+        keys, mask = self.keys, self.mask
+        pos = (key * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        free = -1
+        while True:
+            current = keys[pos]
+            if current == key:
+                return pos
+            if current == self.EMPTY:
+                return pos if free < 0 else free
+            if current == self.DELETED and free < 0:
+                free = pos
+            pos = (pos + 1) & mask
+
+    def get(self, key, default=None):
+        pos = self._probe(key)
+        if self.keys[pos] != key:
+            return default
+        return self.values[pos] if self.with_values else key
+
+    def put(self, key, value=0):
+        """ Insert or update `key`. """
+        pos = self._probe(key)
+        current = self.keys[pos]
+        if current != key:
+            self.keys[pos] = key
+            self.used += 1
+            if current == self.EMPTY:
+                self.filled += 1
+        if self.with_values:
+            self.values[pos] = value
+        if self.filled > self.MAX_LOAD * len(self.keys):
+            self._resize()
+
+    def pop(self, key, default=None):
+        """ Remove `key` and return its value. """
+        pos = self._probe(key)
+        if self.keys[pos] != key:
+            return default
+        self.keys[pos] = self.DELETED
+        self.used -= 1
+        return self.values[pos] if self.with_values else key
+
+    def _resize(self):
+        keys, values = self.keys_array(), self.values_array()
+        capacity = len(self.keys)
+        while self.used > self.MAX_LOAD * capacity / 2:
+            capacity *= 2
+        self._allocate(capacity)
+        for key, value in zip(keys.tolist(), values.tolist()):
+            self.put(key, value)
+
+    def live(self):
+        """ Return the boolean mask of live entries. """
+        return np.frombuffer(self.keys, dtype=np.int64) >= 0
+
+    def keys_array(self):
+        """ Return all keys as a NumPy array. """
+        return np.frombuffer(self.keys, dtype=np.int64)[self.live()]
+
+    def values_array(self):
+        """ Return all values as a NumPy array, in the order of `keys_array`. """
+        if not self.with_values:
+            return np.zeros(self.used, dtype=np.int64)
+        return np.frombuffer(self.values, dtype=np.int64)[self.live()]
+
+
+class PackedSiteSet(MutableSet):
+    """ Set of index tuples stored as packed integer keys.
+
+        Args:
+            iterable: Optional index tuples to start with.
+    """
+    def __init__(self, iterable=()):
+        self.table = PackedTable(values=False)
+        for site in iterable:
+            self.add(site)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, list(self))
+
+    def __contains__(self, site):
+        return pack(site) in self.table
+
+    def __iter__(self):
+        return (unpack(key) for key in self.table.keys_array().tolist())
+
+    def __len__(self):
+        return len(self.table)
+
+    def add(self, site):
+        self.table.put(pack(site))
+
+    def discard(self, site):
+        self.table.pop(pack(site))
+
+    def array(self):
+        """ Return the sites as an (N, 3) integer array. """
+        return unpack_array(self.table.keys_array())
+
+
+class PackedIndexedSet(MutableSet):
+    """ `IndexedSet` of index tuples stored as packed integer keys.
+
+    The dense `items` array holds the keys, a `PackedTable` maps them to their position.
+
+        Args:
+            iterable: Optional index tuples to start with.
+    """
+    def __init__(self, iterable=()):
+        self.items = array('q')
+        self.position = PackedTable()
+        for site in iterable:
+            self.add(site)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, list(self))
+
+    def __contains__(self, site):
+        return pack(site) in self.position
+
+    def __iter__(self):
+        return (unpack(key) for key in self.items.tolist())
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, site):
+        """ Append `site` to the dense array, if not yet present. """
+        key = pack(site)
+        if key not in self.position:
+            self.position.put(key, len(self.items))
+            self.items.append(key)
+
+    def discard(self, site):
+        """ Remove `site` by moving the last element into its place. """
+        index = self.position.pop(pack(site))
+        if index is None:
+            return
+        last = self.items.pop()
+        if index < len(self.items):
+            self.items[index] = last
+            self.position.put(last, index)
+
+    def pick(self, rand):
+        """ Return the element at the relative position `rand` in [0, 1). """
+        return unpack(self.items[int(rand*len(self.items))])
+
+    def array(self):
+        """ Return the sites as an (N, 3) integer array, in dense order. """
+        return unpack_array(self.items)
+
+
+class PackedSiteMap(MutableMapping):
+    """ Mapping from index tuples to integers stored as packed keys.
+
+        Args:
+            iterable: Optional (site, value) pairs to start with.
+    """
+    def __init__(self, iterable=()):
+        self.table = PackedTable()
+        for site, value in iterable:
+            self[site] = value
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+    def __getitem__(self, site):
+        key = pack(site)
+        value = self.table.get(key)
+        if value is None:
+            raise KeyError(site)
+        return value
+
+    def __setitem__(self, site, value):
+        self.table.put(pack(site), value)
+
+    def __delitem__(self, site):
+        if self.table.pop(pack(site)) is None:
+            raise KeyError(site)
+
+    def __contains__(self, site):
+        return pack(site) in self.table
+
+    def __iter__(self):
+        return (unpack(key) for key in self.table.keys_array().tolist())
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, site, default=None):
+        return self.table.get(pack(site), default)
+
+    def items(self):
+        keys, values = self.table.keys_array(), self.table.values_array()
+        return [(unpack(key), value)
+                for key, value in zip(keys.tolist(), values.tolist())]
+
+    def array(self):
+        """ Return the sites as an (N, 3) integer array. """
+        return unpack_array(self.table.keys_array())
+
+
+class Block():
+    """ Occupancy bitmap of a single block in `ChunkedSiteSet`. """
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, size):
+        self.bits = bytearray(size // 8)
+        self.count = 0
+
+
+class ChunkedSiteSet(MutableSet):
+    """ Set of index tuples stored as bitmaps in fixed-size blocks of the lattice.
+
+    Blocks of `BLOCK_BITS` (as powers of two in i, j and k) are allocated when the first
+    site inside is added and dropped when the last one is removed. Flat blocks fit the
+    platelets grown with twin planes, which are wide but only few layers high.
+
+    A block is *interior*, if it and all of its 26 adjacent blocks are full. None of its
+    sites has an empty neighbour, which lets `boundary` skip the whole block.
+
+        Args:
+            iterable: Optional index tuples to start with.
+    """
+    BLOCK_BITS = (4, 4, 2)
+
+    def __init__(self, iterable=()):
+        bi, bj, bk = self.BLOCK_BITS
+        self.block_size = 1 << (bi + bj + bk)
+        self.masks = ((1 << bi) - 1, (1 << bj) - 1, (1 << bk) - 1)
+        self.blocks = {}
+        self.length = 0
+        for site in iterable:
+            self.add(site)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, list(self))
+
+    def _locate(self, site):
+        """ Return the block key and the bit position of `site`. """
+        i, j, k = site
+        bi, bj, bk = self.BLOCK_BITS
+        mi, mj, mk = self.masks
+        return ((i >> bi, j >> bj, k >> bk),
+                (i & mi) << (bj + bk) | (j & mj) << bk | (k & mk))
+
+    def __contains__(self, site):
+        key, bit = self._locate(site)
+        block = self.blocks.get(key)
+        return block is not None and block.bits[bit >> 3] >> (bit & 7) & 1 == 1
+
+    def __iter__(self):
+        for key in list(self.blocks):
+            for site in self._block_array(key).tolist():
+                yield tuple(site)
+
+    def __len__(self):
+        return self.length
+
+    def add(self, site):
+        key, bit = self._locate(site)
+        block = self.blocks.get(key)
+        if block is None:
+            block = self.blocks[key] = Block(self.block_size)
+        if not block.bits[bit >> 3] >> (bit & 7) & 1:
+            block.bits[bit >> 3] |= 1 << (bit & 7)
+            block.count += 1
+            self.length += 1
+
+    def discard(self, site):
+        key, bit = self._locate(site)
+        block = self.blocks.get(key)
+        if block is not None and block.bits[bit >> 3] >> (bit & 7) & 1:
+            block.bits[bit >> 3] &= ~(1 << (bit & 7))
+            block.count -= 1
+            self.length -= 1
+            if not block.count:
+                del self.blocks[key]
+
+    def full(self, key):
+        """ Whether the block `key` exists and all its sites are occupied. """
+        block = self.blocks.get(key)
+        return block is not None and block.count == self.block_size
+
+    def interior(self, key):
+        """ Whether the block `key` and its 26 adjacent blocks are full. """
+        bi, bj, bk = key
+        return all(self.full((bi + di, bj + dj, bk + dk))
+                   for di in (-1, 0, 1) for dj in (-1, 0, 1) for dk in (-1, 0, 1))
+
+    def _block_array(self, key):
+        """ Return the occupied sites of block `key` as an (N, 3) integer array. """
+        bi, bj, bk = self.BLOCK_BITS
+        mi, mj, mk = self.masks
+        bits = np.unpackbits(np.frombuffer(bytes(self.blocks[key].bits), dtype=np.uint8),
+                             bitorder='little')
+        local = np.flatnonzero(bits)
+        origin = np.array(key, dtype=np.int64) << np.array(self.BLOCK_BITS)
+        return np.stack((local >> (bj + bk), local >> bk & mj, local & mk),
+                        axis=-1) + origin
+
+    def array(self, skip_interior=False):
+        """ Return the sites as an (N, 3) integer array, optionally without the interior.
+        """
+        arrays = [self._block_array(key) for key in self.blocks
+                  if not (skip_interior and self.interior(key))]
+        if not arrays:
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.concatenate(arrays)
+
+    def boundary(self):
+        """ Iterate over all sites outside of interior blocks. """
+        return (tuple(site) for site in self.array(skip_interior=True).tolist())
+
+
+class SetBackend():
+    """ Sites as Python tuples in sets and dictionaries, the default. """
+    name = 'set'
+    atoms = set
+    slot = IndexedSet
+    index = dict
+
+
+class PackedBackend():
+    """ Sites as packed 64 bit integers in compact arrays, small but slow. """
+    name = 'packed'
+    atoms = PackedSiteSet
+    slot = PackedIndexedSet
+    index = PackedSiteMap
+
+
+class ChunkedBackend():
+    """ Atoms as bitmaps in lattice blocks, surface sites as Python tuples. """
+    name = 'chunked'
+    atoms = ChunkedSiteSet
+    slot = IndexedSet
+    index = dict
+
+
+""" Storage backends selectable for the Flake.
+"""
+BACKENDS = {'set': SetBackend, 'packed': PackedBackend, 'chunked': ChunkedBackend}
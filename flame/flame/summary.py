@@ -0,0 +1,125 @@
+""" Reading the results of a simulation and summarizing them.
+
+The HDF file of a run holds its `parameters` and the snapshots of all samples, in either
+the `table` or `legacy` layout. The summary table holds mean, standard deviation, count
+and quantiles of all columns for each twin plane configuration and `iter`, such that the
+results can be painted without reading every sample again.
+"""
+import logging
+import pandas as pd
+from ast import literal_eval
+
+from flame.settings import HDF_METADATA, HDF_SUMMARY, HDF_TABLE, SUMMARY_QUANTILES
+
+logger = logging.getLogger(__name__)
+
+
+def parameters(h5):
+    """ Return the simulation parameters stored in an open HDF file as dictionary.
+
+    Parameters are either stored as Series of the dictionary or of its string.
+    """
+    stored = h5.select('/' + HDF_METADATA)
+    if 'twins' in stored.index:
+        return stored.to_dict()
+    return literal_eval(stored.iloc[0])
+
+
+def layout(h5):
+    """ Return the layout of an open HDF file, `table` or `legacy`.
+
+    The `table` layout holds all snapshots in a single table, while the `legacy` layout
+    has a `twinplaneNN/flakeNNN` node for each flake.
+    """
+    return 'table' if '/' + HDF_TABLE in h5.keys() else 'legacy'
+
+
+def configurations(h5):
+    """ Return the indices of the twin plane configurations in an open HDF file.
+
+    A file without the snapshots of the samples takes them from its summary table.
+    """
+    if layout(h5) == 'table':
+        return sorted(h5.select_column(HDF_TABLE, 'twin_idx').unique().tolist())
+    if has_summary(h5):
+        return sorted(h5.select_column(HDF_SUMMARY, 'twin_idx').unique().tolist())
+    groups = (group._v_name for group in h5.root)
+    return [int(name[len('twinplane'):]) for name in groups
+            if name.startswith('twinplane')]
+
+
+def configuration_samples(h5, tp_idx):
+    """ Return the concatenated samples of a twin plane configuration.
+
+    The index of each sample is the snapshot number, in the `table` layout we select
+    the rows of the configuration by the indexed `twin_idx` column.
+    """
+    if layout(h5) == 'table':
+        selected = h5.select(HDF_TABLE, where='twin_idx == {}'.format(tp_idx))
+        return selected.drop(columns=['twin_idx', 'sample_idx'])
+    group = h5.get_node('/twinplane{:02}'.format(tp_idx))
+    return pd.concat([h5.select(sample._v_pathname) for sample in group])
+
+
+def summarize(samples, quantiles=SUMMARY_QUANTILES):
+    """ Return the summary of `samples` with `twin_idx` and `iter` columns.
+
+    One row for each configuration and `iter`, with the `count` of samples and for each
+    column `<column>_mean`, `<column>_std` and `<column>_qNN` for the `quantiles`. The
+    quantiles are exact, interpolated linearly between samples like `pandas` does.
+    """
+    grouped = samples.groupby(['twin_idx', 'iter'])
+    stats = [grouped.size().rename('count'),
+             grouped.mean().add_suffix('_mean'),
+             grouped.std().add_suffix('_std')]
+    for q in quantiles:
+        stats.append(grouped.quantile(q).add_suffix('_q{:g}'.format(100 * q)))
+    return pd.concat(stats, axis=1).reset_index()
+
+
+def write_summary(h5, quantiles=SUMMARY_QUANTILES):
+    """ Summarize all samples of an open HDF file into its `HDF_SUMMARY` table.
+
+    An existing summary is replaced. Raises a ValueError if the file holds no samples,
+    e.g. a run which did not keep its raw snapshots.
+    """
+    if layout(h5) == 'table':
+        samples = h5.select(HDF_TABLE).drop(columns='sample_idx')
+    else:
+        samples = pd.concat([configuration_samples(h5, tp_idx).assign(twin_idx=tp_idx)
+                             for tp_idx in configurations(h5)
+                             if '/twinplane{:02}'.format(tp_idx) in h5]
+                            or [pd.DataFrame()])
+    if samples.empty:
+        raise ValueError("No samples to summarize in {}".format(h5.filename))
+    summary = put_summary(h5, summarize(samples, quantiles))
+    logger.info('Summary of {} snapshots written to {}'.format(len(samples),
+                                                               HDF_SUMMARY))
+    return summary
+
+
+def put_summary(h5, summary):
+    """ Put a `summarize` like table into the `HDF_SUMMARY` table of an open HDF file.
+
+    Raises a ValueError for an empty summary, which would hide the results of the file.
+    """
+    if summary.empty:
+        raise ValueError("Empty summary for {}".format(h5.filename))
+    h5.put(HDF_SUMMARY, summary, format='table', data_columns=['twin_idx', 'iter'])
+    return summary
+
+
+def has_summary(h5):
+    """ Whether an open HDF file contains a summary table. """
+    return '/' + HDF_SUMMARY in h5.keys()
+
+
+def summary_means(h5, tp_idx):
+    """ Return the mean of each column over the samples of a configuration from the
+    summary table, with one row per `iter` like the averages of `paint.averaged_planes`.
+    """
+    summary = h5.select(HDF_SUMMARY, where='twin_idx == {}'.format(tp_idx))
+    means = summary.filter(like='_mean')
+    means.columns = [col[:-len('_mean')] for col in means.columns]
+    means.insert(0, 'iter', summary['iter'])
+    return means.reset_index(drop=True)
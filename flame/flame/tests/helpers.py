@@ -0,0 +1,48 @@
+""" Shared fixtures of the tests. HDF files written like a simulation run would.
+"""
+import unittest
+import pandas as pd
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from flame.simulation import SampleWriter
+
+
+def write_samples(folder, twins, samples, layout):
+    """ Write a HDF file into `folder` like a run with the `layout`, return its name.
+
+    The `samples` map (twin index, sample index) to their DataFrame, they are written
+    out of order, as they arrive from the workers.
+    """
+    fname = join(folder, layout + '.h5')
+    with pd.HDFStore(fname) as h5:
+        h5.put('/parameters', pd.Series(str({'twins': twins})))
+        writer = SampleWriter(h5, layout=layout)
+        for (tp, sm), sample in sorted(samples.items(), reverse=True):
+            writer.write(tp, sm, sample)
+    return fname
+
+
+class SampleFiles(unittest.TestCase):
+    """ Samples of a small sweep, written to a temporary folder by `write`.
+
+    Sample `sm` of configuration `tp` has the snapshots at `iter` 11 and 21 with `radius`
+    1 + tp and 2 + sm, and `layers` 1 and 2 + sm.
+    """
+    configurations = 2
+    sample_size = 3
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.twins = [{0}] + [{0, tp} for tp in range(1, self.configurations)]
+        self.samples = {(tp, sm): pd.DataFrame({'iter': [11, 21],
+                                                'radius': [1.0 + tp, 2.0 + sm],
+                                                'layers': [1, 2 + sm]})
+                        for tp in range(self.configurations)
+                        for sm in range(self.sample_size)}
+
+    def write(self, layout):
+        return write_samples(self.tmp.name, self.twins, self.samples, layout)
+
+    def tearDown(self):
+        self.tmp.cleanup()
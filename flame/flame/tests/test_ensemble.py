@@ -0,0 +1,44 @@
+""" Tests for the `ensemble` module. Flakes grown in lockstep.
+"""
+import unittest
+import numpy as np
+from flame.ensemble import Ensemble
+
+
+class TestEnsemble(unittest.TestCase):
+    def setUp(self):
+        self.ensemble = Ensemble(0, 1, size=4, seed='point', temp=200, rng=5)
+
+    def test_same_slots_as_sampler(self):
+        """ The vectorized draw chooses the slots of the `prob` growth mode.
+        """
+        self.ensemble.grow(30)
+        rand = np.random.default_rng(1).random((50, len(self.ensemble)))
+        for row in rand:
+            slots = self.ensemble.draw_slots(row)
+            members = zip(self.ensemble.members, row)
+            expected = [flake.sampler.draw(position) for flake, position in members]
+            self.assertEqual(slots.tolist(), expected)
+
+    def test_counts(self):
+        self.ensemble.grow(25)
+        for flake, counts in zip(self.ensemble.members, self.ensemble.counts):
+            self.assertEqual(flake.sites(), counts.tolist())
+            self.assertEqual(flake.iter, 26)
+            self.assertEqual(flake.geometry(), flake.geometry(full=True))
+
+    def test_run(self):
+        snapshots = self.ensemble.run(40, 10)
+        self.assertEqual(snapshots.shape, (4, 4, len(self.ensemble.columns)))
+        iters = snapshots[:, :, self.ensemble.columns.index('iter')]
+        self.assertTrue((iters == [11, 21, 31, 41]).all())
+        # members grow independently
+        self.assertGreater(len(set(map(frozenset, (flake.atoms for flake in
+                                                   self.ensemble.members)))), 1)
+
+    def test_temp(self):
+        rates = self.ensemble.rates()
+        self.ensemble.temp = 500
+        self.assertEqual(self.ensemble.members[-1].temp, 500)
+        self.assertLess(self.ensemble.rates()[2], rates[2])
+
@@ -2,6 +2,7 @@
 """
 from __future__ import print_function, division, generators
 import unittest
+from itertools import product
 from testfixtures import LogCapture
 from flame.grid import Grid, Vector, Seed
 
@@ -100,6 +101,60 @@ class TestTwinnedGrid(unittest.TestCase):
         for i in range(-20, -1):
             self.assertEqual(self.tGrid.shift(i), i % 3)
 
+    def test_neighbour_tables(self):
+        """ The tabulated neighbours must match a plain distance check.
+        """
+        for atom in product(range(-2, 3), range(-2, 3), range(-4, 5)):
+            center = self.tGrid.coord(atom)
+            nearest = {nb for nb in product(*(range(x - 1, x + 2) for x in atom))
+                       if 0 < center.dist(self.tGrid.coord(nb)) < ATOM_DIA + 0.1}
+            self.assertEqual(nearest, set(self.tGrid.neighbours(atom)))
+            self.assertEqual(len(self.tGrid.neighbours(atom)), 12)
+
+        self.assertIs(Grid((1, -1)).nb_tables, self.tGrid.nb_tables)
+
+    def test_shift_table(self):
+        layers = list(range(-150, 150, 7)) + list(range(149, -151, -3))
+        for grid in (Grid(()), Grid((4, 5, 6)), self.tGrid):
+            for layer in layers:
+                self.assertEqual(grid.shift(layer), grid.layer_shift(layer))
+            self.assertLessEqual(grid.shift_low, -150)
+            self.assertEqual(grid.shifts(-3, 4).tolist(),
+                             [grid.layer_shift(x) for x in range(-3, 4)])
+
+    def test_bulk_coords(self):
+        atoms = list(product(range(-3, 4), range(-3, 4), range(-6, 7)))
+        coords = self.tGrid.coords(atoms)
+        self.assertEqual(coords.shape, (len(atoms), 3))
+        for atom, xyz in zip(atoms, coords.tolist()):
+            self.assertEqual(list(self.tGrid.coord(atom)), xyz)
+        self.assertEqual(self.tGrid.coords([]).shape, (0, 3))
+
+    def test_bulk_neighbours(self):
+        atoms = list(product(range(-3, 4), range(-3, 4), range(-6, 7)))
+        neighbours = self.tGrid.neighbour_array(atoms)
+        self.assertEqual(neighbours.shape, (len(atoms), 12, 3))
+        for atom, nearest in zip(atoms, neighbours.tolist()):
+            self.assertEqual(sorted(map(tuple, nearest)),
+                             sorted(self.tGrid.neighbours(atom)))
+        self.assertEqual(self.tGrid.neighbour_array([]).shape, (0, 12, 3))
+
+    def test_enclosed(self):
+        inner = set(product(range(-2, 3), repeat=3))
+        shell = [atom for atom in product(range(-3, 4), repeat=3) if atom not in inner]
+        self.assertEqual(set(map(tuple, self.tGrid.enclosed(shell).tolist())), inner)
+        shell.remove((0, 0, -3))     # open a face
+        self.assertEqual(self.tGrid.enclosed(shell).shape, (0, 3))
+        self.assertEqual(self.tGrid.enclosed([]).shape, (0, 3))
+
+    def test_enclosed_platelet(self):
+        """ A wide platelet with a hole in its middle layer, capped above and below.
+        """
+        hole = set(product(range(-3, 4), range(-3, 4), [0]))
+        plate = [atom for atom in product(range(-60, 61), range(-60, 61), range(-1, 2))
+                 if atom not in hole]
+        self.assertEqual(set(map(tuple, self.tGrid.enclosed(plate).tolist())), hole)
+
 
 class TestSeedGeneration(unittest.TestCase):
     """ Make sure correct seeds are return on correct/invalid/without input.
@@ -137,3 +192,17 @@ class TestSeedGeneration(unittest.TestCase):
 
         lcap.check(('flame.grid', 'WARNING', expected_log))
         self.assertEqual(invalid_seed, self.point_ref_seed)
+
+    def test_parametric_seeds(self):
+        grid = Grid((0,))
+        sphere = Seed.sphere(4, grid)
+        radii = ((grid.coords(sphere) - grid.coords((0, 0, 0)))**2).sum(axis=1)**.5
+        self.assertEqual(len(set(map(tuple, sphere.tolist()))), len(sphere))
+        self.assertLessEqual(radii.max(), 4)
+        self.assertEqual(set(map(tuple, Seed.sphere(2.5, grid).tolist())),
+                         set(grid.neighbours((0, 0, 0))) | {(0, 0, 0)})
+
+        plate = Seed.plate(3, 10)
+        self.assertEqual(sorted(set(plate[:, 2].tolist())), [0, 1, 2])
+        self.assertEqual(len(plate[plate[:, 2] == 0]), len(plate[plate[:, 2] == 1]))
+        self.assertIn([0, 0, 0], plate.tolist())
@@ -1,8 +1,13 @@
 ## encoding: utf-8
 
+import pickle
 import unittest
-from os.path import isfile
+from os import remove
+from os.path import isfile, join, splitext
+from tempfile import TemporaryDirectory
+from flame.grid import Seed
 from flame.growth import Flake
+from flame.storage import site_array
 
 
 class TestFlakeBasics(unittest.TestCase):
@@ -27,20 +32,9 @@ class TestFlakeBasics(unittest.TestCase):
 
 
     def test_neighbours(self):
-        """ Check if the chosen atom has the proper neighbours in index space.
-
-        Ensure this translates into correct atoms considering the real space distance and
-        make sure all neighbours return our seed as non-void neighborhood.
+        """ Check that the neighbours of our seed have the seed as their only non-void
+        neighbour.
         """
-        atom = (2, 5, 8)
-        all_neighbours = [(2, 6, 9), (3, 4, 7), (3, 5, 9), (3, 4, 8), (1, 6, 7),
-                          (3, 6, 7), (2, 4, 7), (2, 5, 7), (1, 5, 9), (1, 5, 8),
-                          (3, 5, 8), (1, 5, 7), (2, 5, 9), (2, 4, 9), (2, 4, 8),
-                          (3, 6, 9), (1, 6, 8), (3, 6, 8), (1, 6, 9), (1, 4, 9),
-                          (3, 5, 7), (1, 4, 8), (3, 4, 9), (2, 6, 8), (2, 6, 7),
-                          (1, 4, 7)]
-        self.assertEqual(set(all_neighbours), set(self.tF.abs_neighbours(atom)))
-
         point_seed = (0, 0, 0)
         next_neighbours = [(0, -1, -1), (0, 0, -1),  (-1, 0, 1),  (-1, 0, 0),
                            (1, 0, 0),   (0, 0, 1),   (0, -1, 1),  (0, -1, 0),
@@ -88,6 +82,18 @@ class TestStaticFlake(unittest.TestCase):
         initp[1] = 12
         self.assertEqual(initp, simple.weights())
 
+    def test_temperature_ramp(self):
+        self.tF.grow(10)
+        for temp in (1000, 500, 0):
+            self.tF.temp = temp
+            self.assertAlmostEqual(self.tF.sampler.total()/sum(self.tF.weights()), 1)
+            self.tF.grow(10)
+            self.assertAlmostEqual(self.tF.sampler.total()/sum(self.tF.weights()), 1)
+
+        self.tF.temp = -10
+        with self.assertRaises(ValueError):
+            self.tF.grow()
+
 
 class TestFlakeGrowth(unittest.TestCase):
     def setUp(self):
@@ -106,6 +112,18 @@ class TestFlakeGrowth(unittest.TestCase):
 
         for flake in (prbF, detF, rndF):
             self.assertEqual(flake.iter, self.rounds + 1)
+            self.assertEqual(flake.geometry()['time'], 0)
+
+    def test_kmc_mode(self):
+        kmcF = Flake(*self.twins, seed=self.seed)
+        times = []
+        for _ in range(self.rounds):
+            kmcF.grow(mode='kmc')
+            times.append(kmcF.geometry()['time'])
+
+        self.assertEqual(kmcF.iter, self.rounds + 1)
+        self.assertEqual(times, sorted(times))
+        self.assertGreater(times[0], 0)
 
     def test_carve(self):
         tF = Flake()
@@ -125,6 +143,28 @@ class TestFlakeGrowth(unittest.TestCase):
         fname = tF.export_coordinates('testexporter010')
         self.assertTrue(isfile(fname))
 
+    def test_import_coordinates(self):
+        tF = Flake(*self.twins, seed='sphere', temp=150, rng=2)
+        tF.grow(10 * self.rounds)
+        atoms = set(tF.atoms)
+        tF.carve()
+        infofile = tF.export_coordinates('testimporter010')
+        xyzfile = splitext(infofile)[0] + '.xyz'
+        try:
+            imported = Flake.import_coordinates(xyzfile)
+            hollow = Flake.import_coordinates(xyzfile, fill=False)
+            with self.assertRaises(ValueError):
+                Flake.import_coordinates(xyzfile, twins=(-2, 2))
+        finally:
+            remove(xyzfile)
+            remove(infofile)
+
+        self.assertEqual((imported.twins, imported.temp), (self.twins, 150))
+        self.assertEqual(set(hollow.atoms), tF.atoms)
+        self.assertFalse(tF.surface[0])         # no bubbles, which would be filled
+        self.assertEqual(imported.atoms, atoms)
+        self.assertEqual(imported.surface, tF.surface)
+
     def test_colorize(self):
         tF = Flake()
         self.assertIsInstance(tF.colorize(), dict)
@@ -140,6 +180,97 @@ class TestFlakeGrowth(unittest.TestCase):
         self.assertEqual(len(plot_data), 4)
         self.assertTrue(all(len(col) == data_length for col in plot_data))
 
+    def test_site_slot_index(self):
+        tF = Flake(*self.twins)
+        tF.grow(self.rounds)
+        tF.grow(self.rounds, mode='rand')
+        index = dict((site, slot) for slot, shelf in enumerate(tF.surface)
+                     for site in shelf)
+        self.assertEqual(index, tF.site_slot)
+        for site, slot in tF.site_slot.items():
+            self.assertEqual(slot % 12, len(tF.real_neighbours(site)))
+
+    def test_backends(self):
+        """ All backends take the same growth path for the same random numbers.
+        """
+        flakes = []
+        for backend in ('set', 'packed', 'chunked'):
+            tF = Flake(*self.twins, seed=self.seed, backend=backend, rng=42)
+            tF.grow(self.rounds)
+            tF.grow(self.rounds, mode='rand')
+            flakes.append(tF)
+
+        plain = flakes.pop(0)
+        for other in flakes:
+            self.assertEqual(plain.atoms, set(other.atoms))
+            self.assertEqual(plain.site_slot, dict(other.site_slot))
+            self.assertEqual(plain.geometry(), other.geometry(full=True))
+
+    def test_save_load(self):
+        """ A loaded Flake continues the growth exactly like the saved one.
+        """
+        for backend in ('set', 'packed', 'chunked'):
+            tF = Flake(*self.twins, seed=self.seed, backend=backend, temp=150, rng=7)
+            tF.grow(self.rounds)
+            tF.grow(self.rounds, mode='kmc')
+            with TemporaryDirectory() as tmp:
+                loaded = Flake.load(tF.save(join(tmp, 'flake')))
+            self.assertEqual(loaded.twins, tF.twins)
+            self.assertEqual(loaded.backend, tF.backend)
+            self.assertEqual(loaded.surface, tF.surface)
+            self.assertEqual(list(loaded.trail), list(tF.trail))
+            for mode in ('prob', 'kmc', 'rand'):
+                tF.grow(self.rounds, mode=mode)
+                loaded.grow(self.rounds, mode=mode)
+            self.assertEqual([list(shelf) for shelf in loaded.surface],
+                             [list(shelf) for shelf in tF.surface])
+            self.assertEqual(set(loaded.atoms), set(tF.atoms))
+            self.assertEqual(loaded.geometry(), tF.geometry())
+
+    def test_fork(self):
+        tF = Flake(*self.twins, seed=self.seed, backend='packed', rng=3)
+        tF.grow(self.rounds)
+        branches = tF.fork(3)
+        for branch in branches:
+            self.assertEqual(branch.surface, tF.surface)
+            self.assertEqual(branch.geometry(), tF.geometry())
+            branch.grow(self.rounds)
+        self.assertNotEqual(branches[0].atoms, branches[1].atoms)
+
+        copy = pickle.loads(pickle.dumps(tF))
+        tF.grow(self.rounds)
+        copy.grow(self.rounds)
+        self.assertEqual(copy.atoms, tF.atoms)
+
+    def test_bulk_surface(self):
+        """ The surface built in bulk matches the neighbour count of each void.
+        """
+        grown = Flake(*self.twins, seed=self.seed, rng=1)
+        grown.grow(10 * self.rounds)
+        for backend in ('set', 'packed', 'chunked'):
+            tF = Flake(*self.twins, seed=site_array(grown.atoms), backend=backend)
+            self.assertEqual((tF.seed_shape, tF.iter), ('custom', grown.iter))
+            reference = [set() for _ in tF.maxNB]
+            for atom in tF.atoms:
+                for void in tF.real_neighbours(atom, void=True):
+                    reference[len(tF.real_neighbours(void)) % 12].add(void)
+            self.assertEqual(tF.surface, reference)
+            self.assertEqual(tF.surface, grown.surface)
+            self.assertEqual(dict(tF.site_slot), dict(grown.site_slot))
+
+    def test_parametric_seed(self):
+        tF = Flake(*self.twins, seed=Seed.sphere(5))
+        tF.grow(self.rounds)
+        self.assertEqual(tF.iter, len(Seed.sphere(5)) + self.rounds)
+
+    def test_incremental_geometry(self):
+        tF = Flake(*self.twins, seed='sphere')
+        for mode in ('prob', 'rand', 'det'):
+            tF.grow(self.rounds, mode=mode)
+            self.assertEqual(tF.geometry(), tF.geometry(full=True))
+        tF.carve()
+        self.assertEqual(tF.geometry(), tF.geometry(full=True))
+
     def test_bubbles(self):
         tF = Flake()
         while not tF.surface[0]:
@@ -1,9 +1,13 @@
+import mock
 import unittest
+import pandas as pd
+from bokeh.plotting import save
 from numpy import float64
-from os import rmdir
-from os.path import isdir, join
+from os import remove, rmdir
+from os.path import isdir, isfile, join
 
 # from flame.settings import HDF_EXT
+from flame.tests.helpers import SampleFiles
 from flame.tests.test_settings import grab_mock, MOCK_DIR
 from flame import paint as P
 
@@ -66,3 +70,98 @@ class TestAveragedPlanes(unittest.TestCase):
         nochoic = P.averaged_planes(grab_first_mock())
         alchoic = P.averaged_planes(grab_first_mock(), allp)
         dare_truth(nochoic, alchoic)
+
+
+class TestLayouts(SampleFiles):
+    """ Both HDF layouts yield the same averages.
+    """
+    configurations = 3
+    sample_size = 2
+
+    def test_table_layout(self):
+        legacy, table = self.write('legacy'), self.write('table')
+        with pd.HDFStore(table, 'r') as h5:
+            self.assertEqual(P.layout(h5), 'table')
+            self.assertEqual(P.configurations(h5), [0, 1, 2])
+        with pd.HDFStore(legacy, 'r') as h5:
+            self.assertEqual(P.layout(h5), 'legacy')
+            self.assertEqual(P.configurations(h5), [0, 1, 2])
+
+        for old, new in zip(P.averaged_planes(legacy, [1, 2]),
+                            P.averaged_planes(table, [1, 2])):
+            self.assertEqual(old[:2], new[:2])
+            pd.testing.assert_frame_equal(old[2], new[2], check_dtype=False)
+        self.assertEqual(new[0], '{0, 2}')
+        self.assertEqual(new[2]['radius'].tolist(), [3.0, 2.5])
+        P.extractor(table)
+
+    def test_parallel(self):
+        for layout in ('legacy', 'table'):
+            fname = self.write(layout)
+            serial = list(P.averaged_planes(fname))
+            parallel = list(P.averaged_planes(fname, processes=2))
+            self.assertEqual([x[:2] for x in parallel], [x[:2] for x in serial])
+            for old, new in zip(serial, parallel):
+                pd.testing.assert_frame_equal(old[2], new[2])
+
+            # a single configuration is averaged without a pool
+            with mock.patch.object(P, 'Pool') as pool:
+                self.assertEqual(len(list(P.averaged_planes(fname, [1], None))), 1)
+                pool.assert_not_called()
+
+    def test_decimate(self):
+        frame = pd.DataFrame({'iter': range(10000), 'radius': [1.0] * 10000})
+        frame.loc[4321, 'radius'] = 9.0
+        reduced = P.decimate(frame, ['radius'], 100)
+        self.assertLessEqual(len(reduced), 200)
+        self.assertEqual(reduced['radius'].max(), 9.0)
+        self.assertEqual(len(P.decimate(frame[:150], ['radius'], 100)), 150)
+
+    def test_decimated_plot(self):
+        fname = self.write('table')
+        with mock.patch.object(P, 'show', save):
+            P.mean_plot(fname, 'radius', 'iter', processes=1, decimated=True)
+        output_dir, _, _ = P.cols_output(fname)
+        html = join(output_dir, 'geometry_2_cols.html')
+        with open(html) as handler:
+            content = handler.read()
+        remove(html)
+        rmdir(output_dir)
+        self.assertIn('"output_backend":"webgl"', content.replace(' ', ''))
+        # one data source per configuration, shared by both figures
+        self.assertEqual(content.count('"type":"object","name":"ColumnDataSource"'), 3)
+
+    def test_all_columns(self):
+        # files written before the `time` column get only their own columns
+        fname = self.write('table')
+        with mock.patch.object(P, 'show', save):
+            P.mean_plot(fname, 'all', processes=1)
+        output_dir, _, _ = P.cols_output(fname)
+        remove(join(output_dir, 'geometry_2_cols.html'))
+        rmdir(output_dir)
+
+    def test_averages_cache(self):
+        fname = self.write('table')
+        averages = P.load_averages(fname)
+        self.assertTrue(isfile(P.cache_path(fname)))
+        with mock.patch.object(P, 'averaged_planes') as averaged:
+            cached = P.load_averages(fname)
+            averaged.assert_not_called()
+        for old, new in zip(averages, cached):
+            pd.testing.assert_frame_equal(old[2], new[2])
+
+        # changing the file invalidates the cache
+        self.samples[(0, 0)]['radius'] += 10
+        remove(fname)
+        self.write('table')
+        self.assertEqual(P.load_averages(fname)[0][2]['radius'].tolist(), [6.0, 7.5])
+        self.assertEqual(len(P.load_averages(fname, [1])), 1)
+
+    def test_averages_without_cache(self):
+        fname = self.write('table')
+        with mock.patch.object(P, 'replace', side_effect=PermissionError('read-only')):
+            averages = P.load_averages(fname)
+        self.assertEqual([x[:2] for x in averages],
+                         [x[:2] for x in P.averaged_planes(fname)])
+        self.assertFalse(isfile(P.cache_path(fname)))
+        self.assertFalse(isfile(P.cache_path(fname) + '.part'))
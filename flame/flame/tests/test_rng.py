@@ -0,0 +1,38 @@
+""" Tests for the `rng` module. Buffered random number streams.
+"""
+import pickle
+import unittest
+import numpy as np
+from flame.rng import RandomStream
+
+
+class TestRandomStream(unittest.TestCase):
+    def test_reproducible(self):
+        first, second = RandomStream(11, buffer_size=8), RandomStream(11, buffer_size=8)
+        numbers = [first.random() for _ in range(20)]
+        self.assertEqual(numbers, [second.random() for _ in range(20)])
+        self.assertEqual(len(set(numbers)), 20)
+        self.assertTrue(all(0 <= x < 1 for x in numbers))
+        # same numbers as the generator, independent of the buffer size
+        reference = np.random.Generator(np.random.PCG64(11)).random(20).tolist()
+        self.assertEqual(numbers, reference)
+
+    def test_state(self):
+        stream = RandomStream(3, buffer_size=8)
+        for consumed in (0, 5, 8, 13):
+            for _ in range(consumed):
+                stream.random()
+            copy = RandomStream.from_state(stream.getstate())
+            self.assertEqual([copy.random() for _ in range(10)],
+                             [stream.random() for _ in range(10)])
+        copy = pickle.loads(pickle.dumps(stream))
+        self.assertEqual(copy.random(), stream.random())
+
+    def test_spawn(self):
+        stream = RandomStream(3)
+        children = stream.spawn(2)
+        again = RandomStream.from_state(stream.getstate()).spawn(1)
+        numbers = [[child.random() for _ in range(5)] for child in children + again]
+        self.assertNotEqual(numbers[0], numbers[1])
+        self.assertEqual(children[0].seed_sequence.spawn_key, (0,))
+        self.assertEqual(again[0].seed_sequence.spawn_key, (2,))
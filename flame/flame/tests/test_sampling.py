@@ -0,0 +1,50 @@
+""" Tests for the `sampling` module. Weighted slot choice.
+"""
+import unittest
+from flame.sampling import SumTree, SlotSampler
+
+
+class TestSumTree(unittest.TestCase):
+    def setUp(self):
+        self.tree = SumTree(12)
+        for index, weight in enumerate((0, 3, 0, 0, 1, 0, 0, 0, 0, 0, 0, 2)):
+            self.tree[index] = weight
+
+    def test_total(self):
+        self.assertEqual(self.tree.total(), 6)
+        self.tree[4] = 0
+        self.assertEqual(self.tree.total(), 5)
+        self.assertEqual(self.tree[1], 3)
+
+    def test_find(self):
+        self.assertEqual(self.tree.find(0), 1)
+        self.assertEqual(self.tree.find(2.9), 1)
+        self.assertEqual(self.tree.find(3), 4)
+        self.assertEqual(self.tree.find(4.5), 11)
+        # never returns empty leaves, even for values beyond the total
+        self.assertEqual(self.tree.find(6), 11)
+
+
+class TestSlotSampler(unittest.TestCase):
+    def setUp(self):
+        self.surface = [set(), {1, 2}, {3}]
+        self.calls = []
+        self.sampler = SlotSampler(self.surface, self.rate)
+
+    def rate(self, slot):
+        self.calls.append(slot)
+        return float(slot)
+
+    def test_cached_rates(self):
+        self.assertEqual(self.sampler.total(), 4)
+        self.assertEqual(self.sampler.total(), 4)
+        self.assertEqual(self.calls, [0, 1, 2])
+
+        self.surface[2].add(4)
+        self.sampler.update(2)
+        self.assertEqual(self.sampler.total(), 6)
+
+        self.sampler.invalidate()
+        self.assertEqual(self.sampler.draw(0.99), 2)
+        self.assertEqual(self.sampler.draw(0), 1)
+        self.assertEqual(len(self.calls), 6)
@@ -1,7 +1,13 @@
 import unittest
+import yaml
+import pandas as pd
+from multiprocessing import Pool
 from os import chdir, listdir, remove
+from os.path import dirname, isdir, isfile, join, splitext
+from tempfile import TemporaryDirectory
 from flame import simulation as S
-from flame.settings import blender_helper
+from flame.settings import blender_helper, get_skel
+from flame.summary import summarize
 from flame.tests.test_settings import MOCK_DIR, grab_mock
 
 
@@ -22,6 +28,109 @@ class TestBuilder(unittest.TestCase):
             for k, v in reference.items():
                 self.assertEqual(type(v), type(testrun.get(k)))
 
+    def test_checkpoint(self):
+        with TemporaryDirectory() as tmp:
+            checkpoint = join(tmp, 'sample.flm')
+            interrupted = S.builder((-2, 2), total_size=100, snapshot_interval=20,
+                                    checkpoint=checkpoint, checkpoint_interval=40,
+                                    flake={'seed': 'point'})
+            first = [next(interrupted) for _ in range(3)]
+            interrupted.close()
+
+            resumed = list(S.builder((-2, 2), total_size=100, snapshot_interval=20,
+                                     checkpoint=checkpoint, checkpoint_interval=40,
+                                     flake={'seed': 'point'}))
+            self.assertEqual(resumed[:2], first[:2])
+            self.assertEqual([x['iter'] for x in resumed], [21, 41, 61, 81, 101])
+
+    def test_prefix(self):
+        params = {'prefix_size': 40, 'total_size': 100, 'snapshot_interval': 20,
+                  'flake': {'seed': 'point'}}
+        tp_idx, prefix = S.growth_prefix((3, (-2, 2), params))
+        self.assertEqual(tp_idx, 3)
+
+        samples = [list(S.builder((-2, 2), prefix=prefix, **params)) for _ in range(2)]
+        for sample in samples:
+            self.assertEqual(sample[:2], prefix[1])
+            self.assertEqual([x['iter'] for x in sample], [21, 41, 61, 81, 101])
+
+
+class TestTasks(unittest.TestCase):
+    def test_all_samples(self):
+        params = {'sample_size': 3, 'total_size': 100}
+        twins = [{0}, {0, 1}]
+        todo = S.tasks(twins, params)
+
+        self.assertEqual(len(todo), 6)
+        self.assertEqual(sorted((tp, sm) for tp, sm, _, _ in todo),
+                         [(tp, sm) for tp in range(2) for sm in range(3)])
+        for tp_idx, _, twin, _ in todo:
+            self.assertIs(twin, twins[tp_idx])
+
+    def test_prefixes(self):
+        params = {'sample_size': 2, 'total_size': 100, 'prefix_size': 40,
+                  'snapshot_interval': 20, 'flake': {'seed': 'point'}}
+        twins = [(0,), (0, 1)]
+        prefixes = dict([S.growth_prefix((1, twins[1], params))])
+        todo = S.tasks(twins, params, prefixes)
+
+        self.assertEqual([tp for tp, _, _, _ in todo], [0, 0, 1, 1])
+        self.assertEqual(['prefix' in task_params for _, _, _, task_params in todo],
+                         [False, False, True, True])
+        self.assertIs(todo[2][3]['prefix'], prefixes[1])
+
+
+class TestBoundedResults(unittest.TestCase):
+    def test_backpressure(self):
+        params = {'sample_size': 3, 'total_size': 20, 'snapshot_interval': 10,
+                  'flake': {'seed': 'point'}}
+        todo = S.tasks([(0,), (1, 2)], params)
+        with Pool(2) as p:
+            results = list(S.bounded_results(p, todo, chunksize=2, max_inflight=1))
+
+        self.assertEqual(sorted((tp, sm) for tp, sm, _ in results),
+                         sorted((tp, sm) for tp, sm, _, _ in todo))
+        for _, _, sample in results:
+            self.assertEqual(list(sample['iter']), [11, 21])
+
+    def test_worker_error(self):
+        todo = S.tasks([(0,)], {'sample_size': 8, 'total_size': 20,
+                                'flake': {'seed': 'point', 'temp': -1}})
+        with Pool(2) as p:
+            with self.assertRaises(ValueError):
+                list(S.bounded_results(p, todo, max_inflight=2))
+            # nothing is left in flight, such that the pool shuts down cleanly
+            p.close()
+            p.join()
+
+    def test_stop_early(self):
+        params = {'sample_size': 8, 'total_size': 20, 'snapshot_interval': 10,
+                  'flake': {'seed': 'point'}}
+        with Pool(2) as p:
+            results = S.bounded_results(p, S.tasks([(0,)], params), max_inflight=2)
+            next(results)
+            results.close()
+            p.close()
+            p.join()
+
+
+class TestSampleWriter(unittest.TestCase):
+    def test_stats_interval(self):
+        sample = pd.DataFrame({'iter': [11, 21], 'radius': [1.0, 2.0]})
+        with TemporaryDirectory() as tmp:
+            fname = join(tmp, 'run.h5')
+            with pd.HDFStore(fname) as h5:
+                writer = S.SampleWriter(h5, 1, manifest=S.manifest_path(fname),
+                                        accumulator=S.Accumulator(),
+                                        stats=S.stats_path(fname), stats_interval=3600)
+                for sample_idx in range(3):
+                    writer.write(0, sample_idx, sample)
+                self.assertEqual(len(S.read_manifest(fname)), 3)
+                self.assertFalse(isfile(S.stats_path(fname)))
+
+                writer.flush(final=True)
+                self.assertEqual(S.load_stats(fname).done, S.read_manifest(fname))
+
 
 class TestSimulationRun(unittest.TestCase):
     """ Run complete Simulation from mock directory.
@@ -34,7 +143,8 @@ class TestSimulationRun(unittest.TestCase):
                        'values': [1],
                        'sample_size': 2,
                        'snapshot_interval': 10,
-                       'total_size': 30}
+                       'total_size': 30,
+                       'pool': {'processes': 2, 'chunksize': 1}}
 
     def test_run_with_params(self):
         start_list = grab_mock()
@@ -43,10 +153,108 @@ class TestSimulationRun(unittest.TestCase):
         # Here we only test if the directory content changed
         self.assertNotEqual(start_list, grab_mock())
 
+    def test_default_layout(self):
+        # the same layout as in the parameters of new projects
+        self.assertEqual(yaml.safe_load(get_skel(self.name))['layout'], 'table')
+        S.run(self.params)
+        fname = [x for x in grab_mock() if x.startswith(self.name) and
+                 x.endswith('.h5')][0]
+        with pd.HDFStore(fname, 'r') as h5:
+            self.assertEqual(S.parameters(h5)['layout'], 'table')
+            self.assertIn('/flakes', h5.keys())
+            samples = h5.select('flakes').drop(columns='sample_idx')
+            summary = h5.select('summary')
+        # the same exact quantiles as `flame aggregate` writes
+        pd.testing.assert_frame_equal(summary, summarize(samples))
+
+    def test_resume(self):
+        self.params.update(layout='table', checkpoint_interval=10,
+                           flake={'seed': 'point'})
+        S.run(self.params)
+        fname = [x for x in grab_mock() if x.startswith(self.name) and
+                 x.endswith('.h5')][0]
+        self.assertEqual(len(S.read_manifest(fname)), 2)
+        checkpoints = S.checkpoint_folder(splitext(fname)[0])
+        self.assertFalse(isdir(checkpoints))
+
+        # forget about the second sample, as if the run was killed
+        with open(S.manifest_path(fname)) as handler:
+            first = handler.readline()
+        with open(S.manifest_path(fname), 'w') as handler:
+            handler.write(first)
+
+        S.run(resume=fname)
+        self.assertEqual(S.read_manifest(fname), {(0, 0), (0, 1)})
+        self.assertFalse(isdir(checkpoints))
+        with pd.HDFStore(fname, 'r') as h5:
+            flakes = h5.select('flakes')
+            summary = h5.select('summary')
+        self.assertEqual(len(flakes), 6)
+        self.assertEqual(sorted(set(zip(flakes['sample_idx'], flakes['iter']))),
+                         [(0, 11), (0, 21), (0, 31), (1, 11), (1, 21), (1, 31)])
+        # the statistics of the first sample are taken from the file
+        self.assertEqual(S.load_stats(fname).done, {(0, 0), (0, 1)})
+        self.assertEqual(summary['count'].tolist(), [2, 2, 2])
+
+    def test_prefix_run(self):
+        self.params.update(layout='table', prefix_size=20, flake={'seed': 'point'})
+        S.run(self.params)
+        fname = [x for x in grab_mock() if x.startswith(self.name) and
+                 x.endswith('.h5')][0]
+        with pd.HDFStore(fname, 'r') as h5:
+            flakes = h5.select('flakes')
+        shared = flakes[flakes['iter'] < 20].drop(columns='sample_idx')
+        self.assertEqual(len(flakes), 6)
+        self.assertTrue((shared.iloc[0] == shared.iloc[1]).all())
+
+    def test_regenerate(self):
+        self.params.update(layout='table', flake={'seed': 'point'})
+        S.run(self.params)
+        fname = [x for x in grab_mock() if x.startswith(self.name) and
+                 x.endswith('.h5')][0]
+        with pd.HDFStore(fname, 'r') as h5:
+            seed = S.parameters(h5)['rng_seed']
+            flakes = h5.select('flakes', where='sample_idx == 1')
+        self.assertIsInstance(seed, int)
+
+        sample = S.regenerate(fname, 0, 1)
+        stored = flakes.drop(columns=['twin_idx', 'sample_idx'])
+        pd.testing.assert_frame_equal(sample, stored[sample.columns])
+
+    def test_summary_only(self):
+        self.params.update(layout='table', keep_raw=False, flake={'seed': 'point'})
+        S.run(dict(self.params))
+        S.run(dict(self.params))
+        shards = sorted(x for x in grab_mock() if x.startswith(self.name) and
+                        x.endswith('.h5'))
+        summaries = []
+        for fname in shards:
+            with pd.HDFStore(fname, 'r') as h5:
+                self.assertEqual(h5.keys(), ['/parameters', '/summary'])
+                summaries.append(h5.select('summary'))
+            self.assertEqual(summaries[-1]['count'].tolist(), [2, 2, 2])
+
+        S.merge_shards(self.name + '_merged.h5', *shards)
+        with pd.HDFStore(self.name + '_merged.h5', 'r') as h5:
+            merged = h5.select('summary')
+            self.assertEqual(S.parameters(h5)['shards'], shards)
+        self.assertEqual(merged['count'].tolist(), [4, 4, 4])
+        self.assertEqual(merged['iter'].tolist(), [11, 21, 31])
+        with self.assertRaisesRegex(ValueError, 'same random seed'):
+            S.merge_shards(self.name + '_twice.h5', shards[0], shards[0])
+
+        # without the raw samples and statistics the samples are grown again
+        remove(S.stats_path(shards[0]))
+        S.run(resume=shards[0])
+        with pd.HDFStore(shards[0], 'r') as h5:
+            pd.testing.assert_frame_equal(h5.select('summary'), summaries[0])
+
     def tearDown(self):
-        _, xfile, ifile = blender_helper(self.name)
-        remove(xfile)
-        remove(ifile)
+        # the exported coordinates are time stamped, remove all of this run
+        _, xfile, _ = blender_helper(self.name)
+        for export in listdir(dirname(xfile)):
+            if export.startswith(self.name + '__'):
+                remove(join(dirname(xfile), export))
 
         for testrun in listdir():
             if testrun.startswith(self.name):
@@ -0,0 +1,101 @@
+""" Tests for the `stats` module. Statistics accumulated while a simulation runs.
+"""
+import pickle
+import unittest
+import numpy as np
+import pandas as pd
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from flame import stats as T
+from flame.summary import summarize
+
+
+class TestRunningStats(unittest.TestCase):
+    def test_push_and_merge(self):
+        values = np.random.default_rng(5).normal(3, 2, 1000)
+        whole, first, second = T.RunningStats(), T.RunningStats(), T.RunningStats()
+        for x in values:
+            whole.push(x)
+        for x in values[:300]:
+            first.push(x)
+        for x in values[300:]:
+            second.push(x)
+        first.merge(second)
+        first.merge(T.RunningStats())
+
+        for running in (whole, first):
+            self.assertEqual(running.count, 1000)
+            self.assertAlmostEqual(running.mean, values.mean())
+            self.assertAlmostEqual(running.std, values.std(ddof=1))
+
+        running = T.RunningStats()
+        running.push(float('nan'))
+        running.push(1.0)
+        self.assertEqual(running.count, 1)
+        self.assertTrue(np.isnan(running.std))
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def test_quantiles(self):
+        values = np.random.default_rng(7).normal(0, 10, 5000)
+        sketch, first, second = (T.QuantileSketch(0.01) for _ in range(3))
+        for x in values:
+            sketch.push(x)
+        for x in values[:1000]:
+            first.push(x)
+        for x in values[1000:]:
+            second.push(x)
+        first.merge(second)
+
+        for q in (0.1, 0.5, 0.9):
+            exact = np.quantile(values, q, method='lower')
+            for estimate in (sketch.quantile(q), first.quantile(q)):
+                self.assertLessEqual(abs(estimate - exact), 0.01 * abs(exact) + 1e-12)
+        self.assertEqual(sketch.quantile(0.5), first.quantile(0.5))
+        self.assertTrue(np.isnan(T.QuantileSketch().quantile(0.5)))
+        with self.assertRaises(ValueError):
+            sketch.merge(T.QuantileSketch(0.05))
+
+
+class TestAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.samples = {(tp, sm): pd.DataFrame({'iter': [11, 21],
+                                                'radius': rng.uniform(1, 5, 2),
+                                                'layers': rng.integers(1, 9, 2)})
+                        for tp in range(2) for sm in range(20)}
+
+    def test_summary(self):
+        whole, first, second = T.Accumulator(), T.Accumulator(), T.Accumulator()
+        for (tp, sm), sample in self.samples.items():
+            whole.add(tp, sm, sample)
+            (first if sm % 2 else second).add(tp, sm, sample)
+        first.merge(pickle.loads(pickle.dumps(second)))
+        self.assertEqual(first.done, set(self.samples))
+
+        samples = pd.concat(sample.assign(twin_idx=tp)
+                            for (tp, _), sample in self.samples.items())
+        exact = summarize(samples)
+        grouped = samples.groupby(['twin_idx', 'iter'])
+        lower = grouped.quantile(0.25, interpolation='lower')
+        for accumulator in (whole, first):
+            summary = accumulator.summary()
+            self.assertEqual(list(summary.columns), list(exact.columns))
+            self.assertEqual(summary['count'].tolist(), exact['count'].tolist())
+            moments = [col for col in exact.columns if '_q' not in col]
+            pd.testing.assert_frame_equal(summary[moments], exact[moments],
+                                          check_dtype=False)
+            # the sketch returns the value at the rank below, within its accuracy
+            for col in ('radius', 'layers'):
+                np.testing.assert_allclose(summary[col + '_q25'], lower[col], rtol=0.01)
+
+    def test_save_load(self):
+        accumulator = T.Accumulator()
+        for (tp, sm), sample in self.samples.items():
+            accumulator.add(tp, sm, sample)
+        with TemporaryDirectory() as tmp:
+            fname = join(tmp, 'run.stats')
+            accumulator.save(fname)
+            pd.testing.assert_frame_equal(T.Accumulator.load(fname).summary(),
+                                          accumulator.summary())
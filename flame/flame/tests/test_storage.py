@@ -0,0 +1,128 @@
+""" Tests for the `storage` module. Site containers of the Flake.
+"""
+import unittest
+from itertools import product
+from flame.storage import (IndexedSet, PackedTable, PackedSiteSet, PackedIndexedSet,
+                           PackedSiteMap, ChunkedSiteSet, pack, unpack, pack_array,
+                           unpack_array, site_array, boundary_sites)
+
+
+class TestIndexedSet(unittest.TestCase):
+    def setUp(self):
+        self.sites = [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)]
+        self.iset = IndexedSet(self.sites)
+
+    def test_set_behaviour(self):
+        self.assertEqual(self.iset, set(self.sites))
+        self.assertEqual(len(self.iset), 4)
+        self.iset.add((0, 0, 0))
+        self.assertEqual(len(self.iset), 4)
+        self.assertIn((1, 0, 0), self.iset)
+
+        with self.assertRaises(KeyError):
+            self.iset.remove((5, 5, 5))
+
+    def test_swap_remove(self):
+        self.iset.remove((1, 0, 0))
+        self.assertNotIn((1, 0, 0), self.iset)
+        self.assertEqual(self.iset.items, [(0, 0, 0), (0, 0, 1), (0, 1, 0)])
+        for index, site in enumerate(self.iset.items):
+            self.assertEqual(self.iset.position[site], index)
+
+        for site in self.sites:
+            self.iset.discard(site)
+        self.assertFalse(self.iset)
+        self.assertEqual(self.iset.position, {})
+
+    def test_pick(self):
+        self.assertEqual(self.iset.pick(0), (0, 0, 0))
+        self.assertEqual(self.iset.pick(0.99), (0, 0, 1))
+        self.assertEqual(self.iset.pick(0.5), (0, 1, 0))
+
+
+class TestPacking(unittest.TestCase):
+    def setUp(self):
+        self.sites = list(product((-2**20, -7, 0, 5, 2**20 - 1), repeat=3))
+
+    def test_roundtrip(self):
+        for site in self.sites:
+            self.assertEqual(unpack(pack(site)), site)
+        keys = pack_array(self.sites)
+        self.assertEqual(keys.tolist(), [pack(site) for site in self.sites])
+        self.assertEqual(unpack_array(keys).tolist(), [list(x) for x in self.sites])
+        self.assertEqual(site_array(set(self.sites[:1])).tolist(), [list(self.sites[0])])
+
+    def test_table(self):
+        table = PackedTable()
+        keys = [pack(site) for site in self.sites]
+        for value, key in enumerate(keys):
+            table.put(key, value)
+        self.assertEqual(len(table), len(keys))
+        self.assertGreater(len(table.keys), len(keys))
+
+        for key in keys[::2]:
+            table.pop(key)
+        for value, key in enumerate(keys):
+            self.assertEqual(table.get(key), None if value % 2 == 0 else value)
+        self.assertEqual(sorted(table.keys_array()), sorted(keys[1::2]))
+
+
+class TestPackedContainers(unittest.TestCase):
+    def setUp(self):
+        self.sites = [(0, 0, 0), (1, 0, 0), (0, -1, 0), (0, 0, 1)]
+
+    def test_site_set(self):
+        atoms = PackedSiteSet(self.sites)
+        self.assertEqual(atoms, set(self.sites))
+        atoms.discard((1, 0, 0))
+        self.assertNotIn((1, 0, 0), atoms)
+        self.assertEqual(sorted(map(tuple, atoms.array().tolist())),
+                         sorted(set(self.sites) - {(1, 0, 0)}))
+
+    def test_indexed_set(self):
+        packed, plain = PackedIndexedSet(self.sites), IndexedSet(self.sites)
+        for each in (packed, plain):
+            each.remove((1, 0, 0))
+        self.assertEqual(list(packed), list(plain))
+        for rand in (0, 0.5, 0.9):
+            self.assertEqual(packed.pick(rand), plain.pick(rand))
+
+    def test_site_map(self):
+        index = PackedSiteMap((site, slot) for slot, site in enumerate(self.sites))
+        self.assertEqual(dict(index), dict((s, n) for n, s in enumerate(self.sites)))
+        self.assertEqual(index.get((7, 7, 7)), None)
+        del index[(0, 0, 0)]
+        with self.assertRaises(KeyError):
+            index[(0, 0, 0)]
+
+
+class TestChunkedSiteSet(unittest.TestCase):
+    def setUp(self):
+        self.sites = set(product(range(-48, 48), range(-48, 48), range(-8, 8)))
+        self.chunks = ChunkedSiteSet(self.sites)
+
+    def test_set_behaviour(self):
+        self.assertEqual(len(self.chunks), len(self.sites))
+        self.assertEqual(self.chunks, self.sites)
+        self.assertIn((-48, 47, -8), self.chunks)
+        self.assertNotIn((48, 0, 0), self.chunks)
+
+        self.chunks.discard((-48, 47, -8))
+        self.assertNotIn((-48, 47, -8), self.chunks)
+        self.assertEqual(len(self.chunks), len(self.sites) - 1)
+
+        single = ChunkedSiteSet([(100, -3, 7)])
+        single.remove((100, -3, 7))
+        self.assertEqual(single.blocks, {})
+
+    def test_interior(self):
+        interior = [key for key in self.chunks.blocks if self.chunks.interior(key)]
+        self.assertEqual(len(interior), 32)
+
+        boundary = set(boundary_sites(self.chunks))
+        self.assertLess(len(boundary), len(self.sites))
+        for site in sorted(self.sites - boundary)[::101]:
+            nearest = product(*(range(x - 1, x + 2) for x in site))
+            self.assertTrue(all(nb in self.chunks for nb in nearest))
+
+        self.assertEqual(sorted(boundary_sites(self.sites)), sorted(self.sites))
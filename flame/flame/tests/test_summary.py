@@ -0,0 +1,49 @@
+""" Tests for the `summary` module. Summary tables of the simulation results.
+"""
+import pandas as pd
+
+from flame import paint as P
+from flame import summary as Y
+from flame.stats import Accumulator
+from flame.tests.helpers import SampleFiles
+
+
+class TestSummary(SampleFiles):
+    def test_summarize(self):
+        samples = pd.concat(sample.assign(twin_idx=tp)
+                            for (tp, _), sample in self.samples.items())
+        summary = Y.summarize(samples, quantiles=(0.5,))
+
+        self.assertEqual(summary[['twin_idx', 'iter']].values.tolist(),
+                         [[0, 11], [0, 21], [1, 11], [1, 21]])
+        self.assertEqual(summary['count'].tolist(), [3, 3, 3, 3])
+        self.assertEqual(summary['radius_mean'].tolist(), [1.0, 3.0, 2.0, 3.0])
+        self.assertEqual(summary['radius_std'].tolist(), [0.0, 1.0, 0.0, 1.0])
+        self.assertEqual(summary['layers_q50'].tolist(), [1.0, 3.0, 1.0, 3.0])
+
+    def test_paint_from_summary(self):
+        for layout in ('table', 'legacy'):
+            fname = self.write(layout)
+            averaged = list(P.averaged_planes(fname))
+            with pd.HDFStore(fname) as h5:
+                self.assertFalse(Y.has_summary(h5))
+                Y.write_summary(h5)
+                self.assertTrue(Y.has_summary(h5))
+                self.assertEqual(Y.configurations(h5), [0, 1])
+
+            for old, new in zip(averaged, P.averaged_planes(fname)):
+                self.assertEqual(old[:2], new[:2])
+                pd.testing.assert_frame_equal(old[2].reset_index(drop=True),
+                                              new[2][old[2].columns], check_dtype=False)
+
+    def test_no_samples(self):
+        """ A run without raw snapshots, like `keep_raw=False` before its summary.
+        """
+        self.samples = {}
+        for layout in ('table', 'legacy'):
+            with pd.HDFStore(self.write(layout)) as h5:
+                with self.assertRaisesRegex(ValueError, 'No samples'):
+                    Y.write_summary(h5)
+                with self.assertRaisesRegex(ValueError, 'Empty summary'):
+                    Y.put_summary(h5, Accumulator().summary())
+                self.assertFalse(Y.has_summary(h5))